@@ -21,3 +21,137 @@ func! TmuxdirEagerMode()
     return v:false
   endif
 endfunc
+
+func! TmuxdirScanWorkers()
+  if exists('g:tmuxdir_scan_workers')
+    return eval('g:tmuxdir_scan_workers')
+  else
+    return 1
+  endif
+endfunc
+
+func! TmuxdirWatchMode()
+  if exists('g:tmuxdir_watch_mode')
+    return eval('g:tmuxdir_watch_mode')
+  else
+    return 'off'
+  endif
+endfunc
+
+func! TmuxdirControlMode()
+  if exists('g:tmuxdir_control_mode')
+    return eval('g:tmuxdir_control_mode')
+  else
+    return v:false
+  endif
+endfunc
+
+func! TmuxdirSessionCacheTTL()
+  if exists('g:tmuxdir_session_cache_ttl')
+    return eval('g:tmuxdir_session_cache_ttl')
+  else
+    return 1.0
+  endif
+endfunc
+
+func! TmuxdirExcludePatterns()
+  if exists('g:tmuxdir_exclude_patterns')
+    return eval('g:tmuxdir_exclude_patterns')
+  else
+    return []
+  endif
+endfunc
+
+func! TmuxdirStopAtProjects()
+  if exists('g:tmuxdir_stop_at_projects')
+    return eval('g:tmuxdir_stop_at_projects')
+  else
+    return v:false
+  endif
+endfunc
+
+func! TmuxdirScanBudgetMs()
+  if exists('g:tmuxdir_scan_budget_ms')
+    return eval('g:tmuxdir_scan_budget_ms')
+  else
+    return 0
+  endif
+endfunc
+
+func! TmuxdirGitDiscovery()
+  if exists('g:tmuxdir_git_discovery')
+    return eval('g:tmuxdir_git_discovery')
+  else
+    return v:false
+  endif
+endfunc
+
+func! TmuxdirDaemon()
+  if exists('g:tmuxdir_daemon')
+    return eval('g:tmuxdir_daemon')
+  else
+    return v:false
+  endif
+endfunc
+
+func! TmuxdirStatsEnabled()
+  if exists('g:tmuxdir_stats')
+    return eval('g:tmuxdir_stats')
+  else
+    return v:false
+  endif
+endfunc
+
+func! TmuxdirTraceFile()
+  if exists('g:tmuxdir_trace_file')
+    return expand(eval('g:tmuxdir_trace_file'))
+  else
+    return ''
+  endif
+endfunc
+
+func! TmuxdirPrewarm()
+  if exists('g:tmuxdir_prewarm')
+    return eval('g:tmuxdir_prewarm')
+  else
+    return 0
+  endif
+endfunc
+
+func! TmuxdirPrewarmIdleTimeout()
+  if exists('g:tmuxdir_prewarm_idle_timeout')
+    return eval('g:tmuxdir_prewarm_idle_timeout')
+  else
+    return 1800.0
+  endif
+endfunc
+
+func! TmuxdirPrewarmMemoryMB()
+  if exists('g:tmuxdir_prewarm_memory_mb')
+    return eval('g:tmuxdir_prewarm_memory_mb')
+  else
+    return 1024.0
+  endif
+endfunc
+
+func! TmuxdirSettings()
+  return {
+        \ 'base_dirs': TmuxdirBaseDirs(),
+        \ 'root_markers': TmuxdirRootMarkers(),
+        \ 'eager_mode': TmuxdirEagerMode(),
+        \ 'scan_workers': TmuxdirScanWorkers(),
+        \ 'watch_mode': TmuxdirWatchMode(),
+        \ 'control_mode': TmuxdirControlMode(),
+        \ 'session_cache_ttl': TmuxdirSessionCacheTTL(),
+        \ 'exclude_patterns': TmuxdirExcludePatterns(),
+        \ 'stop_at_projects': TmuxdirStopAtProjects(),
+        \ 'scan_budget_ms': TmuxdirScanBudgetMs(),
+        \ 'git_discovery': TmuxdirGitDiscovery(),
+        \ 'daemon': TmuxdirDaemon(),
+        \ 'stats': TmuxdirStatsEnabled(),
+        \ 'trace_file': TmuxdirTraceFile(),
+        \ 'prewarm': TmuxdirPrewarm(),
+        \ 'prewarm_idle_timeout': TmuxdirPrewarmIdleTimeout(),
+        \ 'prewarm_memory_mb': TmuxdirPrewarmMemoryMB(),
+        \ }
+endfunc
@@ -1,7 +1,9 @@
 import os
+import denite.util
 from denite.kind.openable import Kind as Openable
-from tmuxdir.tmuxdir_facade import TmuxDirFacade, TmuxDirFacadeException
-from typing import List
+from tmuxdir.tmux_session_facade import TmuxFacadeException
+from tmuxdir.tmuxdir_facade import TmuxDirFacade
+from typing import List, Optional
 import tmuxdir.util as util
 
 
@@ -14,65 +16,81 @@ class Kind(Openable):
         self.vim = vim
         self.has_nvim = self.vim.eval("has('nvim')")
         self.vim_bin_path = "vim"
-        self.max_sessions = 10
         if self.has_nvim:
             self.vim_bin_path = "nvim"
-        try:
-            self.root_markers: List[str] = self.vim.eval("TmuxdirRootMarkers()")
-            self.base_dirs: List[str] = self.vim.eval("TmuxdirBaseDirs()")
-            self.tmux_dir = TmuxDirFacade(self.base_dirs, self.root_markers)
-        except TmuxDirFacadeException as e:
-            util.error(self.vim, str(e))
+
+    @property
+    def tmux_dir(self) -> TmuxDirFacade:
+        """Shared TmuxDirFacade."""
+        return TmuxDirFacade.instance(self.vim.eval("TmuxdirSettings()"))
 
     def action_open(self, context: dict) -> None:
-        """Open project dir in a tmux session. If the tmux dir session is already
-        open, it switches to the session."""
+        """Open project dir in a tmux session. If the tmux dir already has a
+        session, it switches to it, the sessions annotated by the source are
+        used if they're there. Otherwise, if a pane of another session is
+        inside the dir, it jumps to it."""
 
-        dir_path = context["targets"][0]["word"]
-        session_name = self.tmux_dir.dir_to_session_name(dir_path=dir_path)
+        target = context["targets"][0]
+        dir_path = target["word"]
 
-        if not self.tmux_dir.sessions().get(session_name):
-            self.tmux_dir.create(
-                session_name=session_name,
-                vim_bin_path=self.vim_bin_path,
-                start_directory=os.path.expanduser(dir_path),
-            )
         try:
-            self.tmux_dir.switch(session_name=session_name)
-        except TmuxDirFacadeException as e:
-            util.error(self.vim, str(e))
+            tmux_dir = self.tmux_dir
+            sessions = target.get("action__sessions")
+            # sessions may have been pre-warmed since the source annotated it
+            if sessions is None or (not sessions and tmux_dir.prewarmer):
+                sessions = tmux_dir.session_index().dir_sessions(dir_path)
+            session_name = (
+                sessions[0]
+                if sessions
+                else tmux_dir.dir_to_session_name(dir_path=dir_path)
+            )
+            batch = tmux_dir.batch()
+            if not sessions:
+                pane = tmux_dir.pane_index().find(os.path.expanduser(dir_path))
+                if pane:
+                    session_name = pane.session_name
+                    batch.select(pane)
+                else:
+                    batch.create(
+                        session_name=session_name,
+                        vim_bin_path=self.vim_bin_path,
+                        start_directory=os.path.expanduser(dir_path),
+                    )
+            elif tmux_dir.prewarmer:
+                tmux_dir.prewarmer.claim(batch, session_name)
+            batch.switch(session_name=session_name)
+            errors = batch.run()
+            self._report(errors)
+            if tmux_dir.prewarmer and not any(errors):
+                tmux_dir.prewarmer.record_open(dir_path, self.vim_bin_path)
+        except TmuxFacadeException as e:
+            denite.util.error(self.vim, str(e))
 
     def action_new(self, context: dict) -> None:
         """Open the project dir in a new tmux session."""
 
         dir_path = context["targets"][0]["word"]
-        session_name = self.tmux_dir.dir_to_session_name(dir_path=dir_path)
 
-        for i in range(self.max_sessions + 1):
-            if i == 0:
-                new_session_name = session_name
-            else:
-                new_session_name = f"{session_name}-{i}"
-
-            if not self.tmux_dir.sessions().get(new_session_name):
-                if dir_path.endswith(f"-{i}"):
-                    dir_path = dir_path[:-len(f"-{i}")]
-                self.tmux_dir.create(
-                    session_name=new_session_name,
-                    vim_bin_path=self.vim_bin_path,
-                    start_directory=os.path.expanduser(dir_path),
-                )
-                try:
-                    self.tmux_dir.switch(session_name=new_session_name)
-                except TmuxDirFacadeException as e:
-                    util.error(self.vim, str(e))
-                return
+        try:
+            tmux_dir = self.tmux_dir
+            session_name = tmux_dir.dir_to_session_name(dir_path=dir_path)
+            new_session_name = tmux_dir.next_session_name(session_name)
+            batch = tmux_dir.batch()
+            batch.create(
+                session_name=new_session_name,
+                vim_bin_path=self.vim_bin_path,
+                start_directory=os.path.expanduser(dir_path),
+            )
+            batch.switch(session_name=new_session_name)
+            self._report(batch.run())
+        except TmuxFacadeException as e:
+            denite.util.error(self.vim, str(e))
 
-        util.error(
-            self.vim,
-            f"Maximum number of sessions {self.max_sessions} for this dir "
-            f"{dir_path} has been reached.",
-        )
+    def _report(self, errors: List[Optional[TmuxFacadeException]]) -> None:
+        """Report the errors of a batch."""
+        for err in errors:
+            if err:
+                denite.util.error(self.vim, str(err))
 
     def action_delete(self, context: dict) -> None:
         """Ignore selected directory tmux session(s)."""
@@ -84,8 +102,9 @@ class Kind(Openable):
         ):
             return
         try:
-            for item in context["targets"]:
-                dir_path = item["word"]
-                self.tmux_dir.ignore(input_dir=dir_path)
-        except TmuxDirFacadeException as e:
-            util.error(self.vim, str(e))
+            tmux_dir = self.tmux_dir
+            with tmux_dir.deferred_save():
+                for item in context["targets"]:
+                    tmux_dir.ignore(input_dir=item["word"])
+        except TmuxFacadeException as e:
+            denite.util.error(self.vim, str(e))
@@ -1,7 +1,8 @@
 import denite.util
 import tmuxdir.util as util
 from denite.kind.openable import Kind as Openable
-from tmuxdir.tmux_session_facade import TmuxSessionFacade, TmuxFacadeException
+from tmuxdir.tmux_session_facade import TmuxFacadeException
+from tmuxdir.tmuxdir_facade import TmuxDirFacade
 
 
 class Kind(Openable):
@@ -11,13 +12,25 @@ class Kind(Openable):
         self.name = "tmux_session"
         self.default_action = "open"
         self.vim = vim
-        self.tmuxf = TmuxSessionFacade()
+
+    @property
+    def tmuxf(self) -> TmuxDirFacade:
+        """Shared TmuxDirFacade."""
+        return TmuxDirFacade.instance(self.vim.eval("TmuxdirSettings()"))
 
     def action_open(self, context) -> None:
-        """Switch to the first tmux selected session."""
+        """Switch to the first tmux selected session, claiming it if it's
+        pre-warmed."""
         session_name = context["targets"][0]["word"]
         try:
-            self.tmuxf.switch(session_name=session_name)
+            tmuxf = self.tmuxf
+            batch = tmuxf.batch()
+            if tmuxf.prewarmer:
+                tmuxf.prewarmer.claim(batch, session_name)
+            batch.switch(session_name=session_name)
+            for err in batch.run():
+                if err:
+                    denite.util.error(self.vim, str(err))
         except TmuxFacadeException as e:
             denite.util.error(self.vim, str(e))
 
@@ -30,9 +43,12 @@ class Kind(Openable):
             ),
         ):
             return
-        for item in context["targets"]:
-            session_name = item["word"]
-            try:
-                self.tmuxf.kill(session_name=session_name)
-            except TmuxFacadeException as e:
-                denite.util.error(self.vim, str(e))
+        try:
+            batch = self.tmuxf.batch()
+            for item in context["targets"]:
+                batch.kill(session_name=item["word"])
+            for err in batch.run():
+                if err:
+                    denite.util.error(self.vim, str(err))
+        except TmuxFacadeException as e:
+            denite.util.error(self.vim, str(e))
@@ -1,6 +1,11 @@
+import queue
+import threading
+import time
 import denite.util as util
 from denite.source.base import Base
-from tmuxdir.tmuxdir_facade import TmuxDirFacade, TmuxDirFacadeException
+from typing import Dict, Optional
+from tmuxdir.tmux_session_facade import TmuxFacadeException
+from tmuxdir.tmuxdir_facade import SessionIndex, TmuxDirFacade
 
 
 class Source(Base):
@@ -12,6 +17,12 @@ class Source(Base):
         self.vim = vim
         self.sort_by: str = "word"
         self.sort_reversed: bool = True
+        self.batch_size: int = 64
+        self.time_to_first_candidate: float = 0.0
+
+        self._queue: queue.Queue = queue.Queue()
+        self._gathered: Dict[str, dict] = {}
+        self._session_index: Optional[SessionIndex] = None
 
     def highlight(self):
         self.vim.command("highlight default link {} Special".format(self.syntax_name))
@@ -20,19 +31,94 @@ class Source(Base):
         super().define_syntax()
 
     def gather_candidates(self, context):
+        if context["is_async"]:
+            return self._gather_async(context)
 
+        start = time.monotonic()
         try:
-            self.tmuxf = TmuxDirFacade(
-                base_dirs=self.vim.eval("TmuxdirBaseDirs()"),
-                root_markers=self.vim.eval("TmuxdirRootMarkers()"),
-                eager_mode=self.vim.eval("TmuxdirEagerMode()"),
-            )
-        except TmuxDirFacadeException as e:
+            self.tmuxf = TmuxDirFacade.instance(self.vim.eval("TmuxdirSettings()"))
+            cached_dirs = self.tmuxf.cached_dirs()
+        except TmuxFacadeException as e:
             util.error(self.vim, str(e))
+            return []
+
+        # cached dirs are shown right away, while sessions are listed and
+        # fresh dirs are streamed in batches in the background
+        self._queue = queue.Queue()
+        self._gathered = {}
+        self._session_index = None
+        threading.Thread(
+            target=self._scan, args=(self.tmuxf, self._queue), daemon=True
+        ).start()
+        context["is_async"] = True
+        candidates = self._convert(cached_dirs)
+        self.time_to_first_candidate = (time.monotonic() - start) * 1000
+        return candidates
+
+    def _scan(self, tmuxf: TmuxDirFacade, dirs_queue: queue.Queue) -> None:
+        """Put the SessionIndex, or the error listing sessions, and then
+        batches of freshly found dirs on dirs_queue, None when done."""
+        if tmuxf.prewarmer:
+            tmuxf.prewarmer.schedule()
+        try:
+            dirs_queue.put(tmuxf.session_index())
+        except TmuxFacadeException as e:
+            dirs_queue.put(e)
+        batch = []
+        try:
+            for dir_path in tmuxf.iter_dirs():
+                batch.append(dir_path)
+                if len(batch) >= self.batch_size:
+                    dirs_queue.put(batch)
+                    batch = []
+        except TmuxFacadeException as e:
+            dirs_queue.put(e)
+        finally:
+            dirs_queue.put(batch)
+            dirs_queue.put(None)
+
+    def _gather_async(self, context):
+        dirs = []
+        while True:
+            try:
+                batch = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if batch is None:
+                context["is_async"] = False
+                break
+            if isinstance(batch, TmuxFacadeException):
+                util.error(self.vim, str(batch))
+            elif isinstance(batch, SessionIndex):
+                self._session_index = batch
+                # candidates gathered so far are annotated in place
+                for candidate in self._gathered.values():
+                    self._annotate(candidate)
+            else:
+                dirs.extend(batch)
+        return self._convert(dirs)
+
+    def _annotate(self, candidate: dict) -> None:
+        """Annotate a candidate with the names of its open sessions."""
+        if not self._session_index:
+            return
+        dir_path = candidate["word"]
+        sessions = self._session_index.dir_sessions(dir_path)
+        candidate["action__sessions"] = sessions
+        if sessions:
+            candidate["abbr"] = "{} [{}]".format(dir_path, ", ".join(sessions))
 
+    def _convert(self, dirs):
+        """Convert dirs to candidates, the ones with open sessions, annotated
+        with their names, sorted first."""
         candidates = []
-        for dir_path in self.tmuxf.list_dirs():
-            candidates.append({"word": dir_path})
+        for dir_path in dirs:
+            if dir_path not in self._gathered:
+                candidate = self._gathered[dir_path] = {"word": dir_path}
+                self._annotate(candidate)
+                candidates.append(candidate)
         return sorted(
-            candidates, key=lambda x: x[self.sort_by], reverse=self.sort_reversed
+            candidates,
+            key=lambda x: (bool(x.get("action__sessions")), x[self.sort_by]),
+            reverse=self.sort_reversed,
         )
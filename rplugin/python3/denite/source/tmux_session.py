@@ -1,6 +1,7 @@
 import denite.util as util
 from denite.source.base import Base
-from tmuxdir.tmux_session_facade import TmuxSessionFacade, TmuxFacadeException
+from tmuxdir.tmux_session_facade import TmuxFacadeException, TmuxSession
+from tmuxdir.tmuxdir_facade import TmuxDirFacade
 
 
 class Source(Base):
@@ -10,12 +11,9 @@ class Source(Base):
         self.name = "tmux_session"
         self.kind = "tmux_session"
         self.vim = vim
-        self.sort_by = "word"
+        # most recently active sessions first
+        self.sort_by = "activity"
         self.sort_reversed = True
-        try:
-            self.tmuxf = TmuxSessionFacade()
-        except TmuxFacadeException as e:
-            util.error(self.vim, str(e))
 
     def on_init(self, context):
         pass
@@ -32,9 +30,28 @@ class Source(Base):
         )
 
     def gather_candidates(self, context):
-        candidates = []
-        for session in self.tmuxf.sessions().values():
-            candidates.append({"word": session.name})
-        return sorted(
-            candidates, key=lambda x: x[self.sort_by], reverse=self.sort_reversed
+        try:
+            self.tmuxf = TmuxDirFacade.instance(self.vim.eval("TmuxdirSettings()"))
+        except TmuxFacadeException as e:
+            util.error(self.vim, str(e))
+            return []
+
+        sessions = sorted(
+            self.tmuxf.refresh().values(),
+            key=lambda x: getattr(x, self.sort_by),
+            reverse=self.sort_reversed,
         )
+        return [
+            {"word": session.name, "abbr": self._abbr(session)}
+            for session in sessions
+        ]
+
+    def _abbr(self, session: TmuxSession) -> str:
+        details = ["{}w {}p".format(session.windows, session.panes)]
+        if session.attached:
+            details.append("attached")
+        if session.group:
+            details.append("group " + session.group)
+        if session.path:
+            details.append(session.path)
+        return "{} ({})".format(session.name, ", ".join(details))
@@ -1,7 +1,10 @@
+import threading
 import pynvim as nvim
-from typing import List
+from typing import Any, Callable, Dict, List
 
 from tmuxdir.rplugin import TmuxDirPlugin
+from tmuxdir.tmuxdir_facade import TmuxDirFacade
+from tmuxdir.stats import STATS, timed
 from tmuxdir.tmux_session_facade import TmuxFacadeException
 from tmuxdir.util import echoerr, expanduser_raise_if_not_dir
 
@@ -16,6 +19,7 @@ class TmuxDirRPlugin:
             echoerr(nvim, str(e), "tmuxdir")
 
     @nvim.function("TmuxdirCheck", sync=True)
+    @timed("TmuxdirCheck")
     def check_tmux_bin(self, args: List) -> bool:
         try:
             return self._rplugin.tmux_dir._check_tmux_bin()
@@ -30,6 +34,7 @@ class TmuxDirRPlugin:
         return False
 
     @nvim.function("TmuxdirAdd", sync=True)
+    @timed("TmuxdirAdd")
     def tmuxdir_add(self, args: List) -> List[str]:
         if len(args) != 1:
             echoerr(
@@ -41,11 +46,12 @@ class TmuxDirRPlugin:
         try:
             root_dir = expanduser_raise_if_not_dir(args[0])
             return [self._rplugin.tmux_dir._add(root_dir)]
-        except OSError as e:
+        except (OSError, TmuxFacadeException) as e:
             echoerr(self._rplugin.nvim, str(e), self._rplugin.plugin_name)
             return []
 
     @nvim.function("TmuxdirClearAdded", sync=True)
+    @timed("TmuxdirClearAdded")
     def tmuxdir_clear_added(self, args: List) -> bool:
         if len(args) != 1:
             echoerr(
@@ -57,19 +63,30 @@ class TmuxDirRPlugin:
         try:
             root_dir = expanduser_raise_if_not_dir(args[0])
             return self._rplugin.tmux_dir.clear_added_dir(root_dir)
-        except OSError as e:
+        except (OSError, TmuxFacadeException) as e:
             echoerr(self._rplugin.nvim, str(e), self._rplugin.plugin_name)
             return False
 
     @nvim.function("TmuxdirListAdded", sync=True)
+    @timed("TmuxdirListAdded")
     def tmuxdir_list_added(self, args: List) -> List[str]:
-        return self._rplugin.tmuxdir_list_added()
+        try:
+            return self._rplugin.tmuxdir_list_added()
+        except TmuxFacadeException as e:
+            echoerr(self._rplugin.nvim, str(e), self._rplugin.plugin_name)
+            return []
 
     @nvim.function("TmuxdirClearAddedAll", sync=True)
+    @timed("TmuxdirClearAddedAll")
     def tmuxdir_clear_added_dirs(self, args: List) -> bool:
-        return self._rplugin.tmux_dir.clear_added_dirs()
+        try:
+            return self._rplugin.tmux_dir.clear_added_dirs()
+        except TmuxFacadeException as e:
+            echoerr(self._rplugin.nvim, str(e), self._rplugin.plugin_name)
+            return False
 
     @nvim.function("TmuxdirIgnore", sync=True)
+    @timed("TmuxdirIgnore")
     def tmuxdir_ignore(self, args: List) -> bool:
         if len(args) != 1:
             echoerr(
@@ -81,11 +98,12 @@ class TmuxDirRPlugin:
         try:
             root_dir = expanduser_raise_if_not_dir(args[0])
             return self._rplugin.tmux_dir.ignore(root_dir)
-        except OSError as e:
+        except (OSError, TmuxFacadeException) as e:
             echoerr(self._rplugin.nvim, str(e), self._rplugin.plugin_name)
             return False
 
     @nvim.function("TmuxdirClearIgnored", sync=True)
+    @timed("TmuxdirClearIgnored")
     def tmuxdir_clear_ignored(self, args: List) -> bool:
         if len(args) != 1:
             echoerr(
@@ -97,14 +115,152 @@ class TmuxDirRPlugin:
         try:
             root_dir = expanduser_raise_if_not_dir(args[0])
             return self._rplugin.tmux_dir.clear_ignored_dir(root_dir)
-        except OSError as e:
+        except (OSError, TmuxFacadeException) as e:
             echoerr(self._rplugin.nvim, str(e), self._rplugin.plugin_name)
             return False
 
     @nvim.function("TmuxdirListIgnored", sync=True)
+    @timed("TmuxdirListIgnored")
     def tmuxdir_list_ignored(self, args: List) -> List[str]:
-        return self._rplugin.tmuxdir_list_ignored()
+        try:
+            return self._rplugin.tmuxdir_list_ignored()
+        except TmuxFacadeException as e:
+            echoerr(self._rplugin.nvim, str(e), self._rplugin.plugin_name)
+            return []
 
     @nvim.function("TmuxdirClearIgnoredAll", sync=True)
+    @timed("TmuxdirClearIgnoredAll")
     def tmuxdir_clear_ignored_dirs(self, args: List) -> bool:
-        return self._rplugin.tmux_dir.clear_ignored_dirs()
+        try:
+            return self._rplugin.tmux_dir.clear_ignored_dirs()
+        except TmuxFacadeException as e:
+            echoerr(self._rplugin.nvim, str(e), self._rplugin.plugin_name)
+            return False
+
+    @nvim.function("TmuxdirStats", sync=True)
+    def tmuxdir_stats(self, args: List) -> Dict[str, Dict[str, float]]:
+        if args and args[0] == "reset":
+            STATS.reset()
+            return {}
+        return STATS.report()
+
+    @nvim.function("TmuxdirScanStatus", sync=True)
+    def tmuxdir_scan_status(self, args: List) -> Dict[str, Any]:
+        try:
+            return self._rplugin.tmux_dir.scan_status()
+        except TmuxFacadeException as e:
+            echoerr(self._rplugin.nvim, str(e), self._rplugin.plugin_name)
+            return {}
+
+    def _submit(
+        self, name: str, fn: Callable[..., Any], args: List, nargs=0, cancellable=False
+    ) -> int:
+        """Submit fn with the first nargs args as the job of an Async
+        function, an extra last arg being the name of its callback."""
+        if len(args) not in (nargs, nargs + 1):
+            echoerr(
+                self._rplugin.nvim,
+                "{}Async expects {} argument(s) and an optional callback".format(
+                    name, nargs
+                ),
+                self._rplugin.plugin_name,
+            )
+            return 0
+        callback = args[nargs] if len(args) > nargs else ""
+        return self._rplugin.submit(name, fn, args[:nargs], callback, cancellable)
+
+    @nvim.function("TmuxdirAddAsync", sync=True)
+    def tmuxdir_add_async(self, args: List) -> int:
+        return self._submit("TmuxdirAdd", _add, args, nargs=1)
+
+    @nvim.function("TmuxdirAddProjectsAsync", sync=True)
+    def tmuxdir_add_projects_async(self, args: List) -> int:
+        return self._submit(
+            "TmuxdirAddProjects", _add_projects, args, nargs=1, cancellable=True
+        )
+
+    @nvim.function("TmuxdirClearAddedAsync", sync=True)
+    def tmuxdir_clear_added_async(self, args: List) -> int:
+        return self._submit("TmuxdirClearAdded", _clear_added, args, nargs=1)
+
+    @nvim.function("TmuxdirListAddedAsync", sync=True)
+    def tmuxdir_list_added_async(self, args: List) -> int:
+        return self._submit(
+            "TmuxdirListAdded", lambda tmux_dir: list(tmux_dir.dirs), args
+        )
+
+    @nvim.function("TmuxdirClearAddedAllAsync", sync=True)
+    def tmuxdir_clear_added_dirs_async(self, args: List) -> int:
+        return self._submit(
+            "TmuxdirClearAddedAll",
+            lambda tmux_dir: tmux_dir.clear_added_dirs(),
+            args,
+        )
+
+    @nvim.function("TmuxdirIgnoreAsync", sync=True)
+    def tmuxdir_ignore_async(self, args: List) -> int:
+        return self._submit("TmuxdirIgnore", _ignore, args, nargs=1)
+
+    @nvim.function("TmuxdirClearIgnoredAsync", sync=True)
+    def tmuxdir_clear_ignored_async(self, args: List) -> int:
+        return self._submit("TmuxdirClearIgnored", _clear_ignored, args, nargs=1)
+
+    @nvim.function("TmuxdirListIgnoredAsync", sync=True)
+    def tmuxdir_list_ignored_async(self, args: List) -> int:
+        return self._submit(
+            "TmuxdirListIgnored", lambda tmux_dir: list(tmux_dir.ignored_dirs), args
+        )
+
+    @nvim.function("TmuxdirClearIgnoredAllAsync", sync=True)
+    def tmuxdir_clear_ignored_dirs_async(self, args: List) -> int:
+        return self._submit(
+            "TmuxdirClearIgnoredAll",
+            lambda tmux_dir: tmux_dir.clear_ignored_dirs(),
+            args,
+        )
+
+    @nvim.function("TmuxdirCancel", sync=True)
+    def tmuxdir_cancel(self, args: List) -> bool:
+        if len(args) != 1:
+            echoerr(
+                self._rplugin.nvim,
+                "TmuxdirCancel expects a single argument",
+                self._rplugin.plugin_name,
+            )
+            return False
+        try:
+            job_id = int(args[0])
+        except (TypeError, ValueError):
+            echoerr(
+                self._rplugin.nvim,
+                "TmuxdirCancel expects a job id, got {!r}".format(args[0]),
+                self._rplugin.plugin_name,
+            )
+            return False
+        return self._rplugin.jobs.cancel(job_id)
+
+    @nvim.function("TmuxdirJobs", sync=True)
+    def tmuxdir_jobs(self, args: List) -> Dict[str, str]:
+        return {str(k): v for k, v in self._rplugin.jobs.pending().items()}
+
+
+def _add(tmux_dir: TmuxDirFacade, root_dir: str) -> List[str]:
+    return [tmux_dir._add(expanduser_raise_if_not_dir(root_dir))]
+
+
+def _add_projects(
+    tmux_dir: TmuxDirFacade, root_dir: str, cancelled: threading.Event
+) -> List[str]:
+    return tmux_dir.add(expanduser_raise_if_not_dir(root_dir), cancelled)
+
+
+def _clear_added(tmux_dir: TmuxDirFacade, root_dir: str) -> bool:
+    return tmux_dir.clear_added_dir(expanduser_raise_if_not_dir(root_dir))
+
+
+def _ignore(tmux_dir: TmuxDirFacade, root_dir: str) -> bool:
+    return tmux_dir.ignore(expanduser_raise_if_not_dir(root_dir))
+
+
+def _clear_ignored(tmux_dir: TmuxDirFacade, root_dir: str) -> bool:
+    return tmux_dir.clear_ignored_dir(expanduser_raise_if_not_dir(root_dir))
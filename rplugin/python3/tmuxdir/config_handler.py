@@ -2,15 +2,28 @@
 # -*- coding: utf-8 -*-
 import os
 import pickle
-from typing import Dict
+import tempfile
+from typing import Dict, List, Tuple
+
+# journal operations, ("set", key, dir), ("pop", key, dir) or ("clear", key)
+JournalOp = Tuple[str, ...]
 
 
 class ConfigHandler:
 
-    """ConfigHandler responsible for configuration serialization."""
+    """ConfigHandler responsible for configuration serialization.
+
+    The config is persisted as a snapshot, which is always replaced
+    atomically, and an append only journal of operations applied on top of
+    it. Once the journal grows over compact_after operations, it's compacted
+    into a new snapshot.
+    """
 
     def __init__(
-        self, file_name="dirs.pickle", folder_name="~/.config/tmuxdir"
+        self,
+        file_name="dirs.pickle",
+        folder_name="~/.config/tmuxdir",
+        compact_after=1000,
     ) -> None:
         self._file_name = file_name
         self._default_folder = folder_name
@@ -18,17 +31,108 @@ class ConfigHandler:
             os.environ.get("TMUXDIR_CONFIG_FOLDER", self._default_folder)
         )
         self._full_path = os.path.join(self._folder, self._file_name)
+        self._journal_path = self._full_path + ".journal"
+        self._compact_after = compact_after
+        self._journal_len = 0
+        self._mtime: Tuple[int, int] = (0, 0)
 
     def load(self):
-        """Load persisted directories."""
+        """Load persisted directories, replaying the journal."""
         try:
             os.makedirs(self._folder, exist_ok=True)
             with open(self._full_path, "rb") as handle:
-                return pickle.load(handle)
+                dirs = pickle.load(handle)
         except FileNotFoundError:
-            return {}
+            dirs = {}
+        self._journal_len = 0
+        for op in self._read_journal():
+            self._apply(dirs, op)
+            self._journal_len += 1
+        self._mtime = self.mtime()
+        return dirs
 
     def save(self, dirs: Dict[str, Dict[str, str]]):
-        """Serialize directories on file system."""
-        with open(self._full_path, "wb") as handle:
-            pickle.dump(dirs, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        """Serialize directories on file system, atomically replacing the
+        snapshot and discarding the journal."""
+        # a temporary file per save, concurrent savers can't share it
+        fd, tmp_path = tempfile.mkstemp(prefix=self._file_name, dir=self._folder)
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                pickle.dump(dirs, handle, protocol=pickle.HIGHEST_PROTOCOL)
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(tmp_path, self._full_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        try:
+            os.remove(self._journal_path)
+        except FileNotFoundError:
+            pass
+        self._journal_len = 0
+        self._mtime = self.mtime()
+
+    def append(self, ops: List[JournalOp]) -> None:
+        """Append operations to the journal with a single fsync, compacting it
+        if it has grown too long."""
+        if not ops:
+            return
+        with open(self._journal_path, "ab") as handle:
+            for op in ops:
+                pickle.dump(op, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            handle.flush()
+            os.fsync(handle.fileno())
+        self._journal_len += len(ops)
+        self._mtime = self.mtime()
+        if self._journal_len > self._compact_after:
+            self.compact()
+
+    def mtime(self) -> Tuple[int, int]:
+        """mtimes of the snapshot and the journal, 0 if they don't exist."""
+        mtimes = []
+        for path in (self._full_path, self._journal_path):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(0)
+        return mtimes[0], mtimes[1]
+
+    def is_stale(self) -> bool:
+        """Whether the config has been written by someone else since it was
+        last loaded or written here."""
+        return self.mtime() != self._mtime
+
+    def compact(self) -> None:
+        """Fold the journal into a new snapshot."""
+        self.save(self.load())
+
+    def _read_journal(self) -> List[JournalOp]:
+        """Read journal operations. A torn trailing one, left by a crash
+        mid append, is discarded and truncated away, so that operations
+        appended afterwards can be read back."""
+        ops: List[JournalOp] = []
+        good = 0
+        try:
+            with open(self._journal_path, "rb") as handle:
+                while True:
+                    try:
+                        ops.append(pickle.load(handle))
+                    except (EOFError, pickle.UnpicklingError, ValueError, IndexError):
+                        break
+                    good = handle.tell()
+                torn = handle.seek(0, os.SEEK_END) != good
+            if torn:
+                os.truncate(self._journal_path, good)
+        except FileNotFoundError:
+            pass
+        return ops
+
+    @staticmethod
+    def _apply(dirs: Dict[str, Dict[str, str]], op: JournalOp) -> None:
+        """Apply a journal operation on dirs."""
+        if op[0] == "set":
+            dirs.setdefault(op[1], {})[op[2]] = op[2]
+        elif op[0] == "pop":
+            dirs.get(op[1], {}).pop(op[2], None)
+        elif op[0] == "clear":
+            dirs[op[1]] = {}
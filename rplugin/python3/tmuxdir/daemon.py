@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import fcntl
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from tmuxdir.config_handler import ConfigHandler
+from tmuxdir.dirmngr import DirMngr
+from tmuxdir.markers import MarkerException
+
+
+class DaemonException(Exception):
+    def __init__(self, msg: str):
+        super().__init__(msg)
+        self.msg = msg
+
+    def __repr__(self) -> str:
+        return self.msg
+
+
+def socket_path() -> str:
+    """Default socket path, in the config folder."""
+    return os.path.join(ConfigHandler()._folder, "daemon.sock")
+
+
+class _Entry:
+
+    """DirMngr of a set of settings and its last listing."""
+
+    def __init__(self, dir_mngr: DirMngr) -> None:
+        self.dir_mngr = dir_mngr
+        self.lock = threading.Lock()
+        self.listed_at = 0.0
+        self.listed: List[str] = []
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        for line in self.rfile:
+            request = {}
+            try:
+                request = json.loads(line)
+                response = {"result": self.server.dispatch(request)}
+            except (DaemonException, MarkerException) as e:
+                response = {"error": e.msg}
+            except (OSError, ValueError, TypeError, KeyError, AttributeError) as e:
+                response = {"error": str(e)}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            # shut down once the request has been answered
+            if isinstance(request, dict) and request.get("method") == "shutdown":
+                self.server.shutdown()
+                return
+
+
+class DaemonServer(socketserver.ThreadingUnixStreamServer):
+
+    """Index daemon, a single local process owning project scanning and the
+    dirs config, shared by every editor through a Unix domain socket.
+
+    Requests and responses are JSON lines, a request being {"method": ...,
+    "settings": ..., "args": [...]}, settings the DirMngr keyword arguments
+    of the client, and a response either {"result": ...} or {"error": ...}.
+    There's a DirMngr per distinct set of settings.
+
+    Requests modifying dirs are serialized, and so are listings of the same
+    settings: a listing that waited for another one, finished after it was
+    requested, gets its result instead of scanning again. It shuts itself
+    down after idle_timeout seconds without requests, 0 meaning never.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: str, idle_timeout=3600.0) -> None:
+        """Constructor of DaemonServer."""
+        self.socket_path = path
+        self.idle_timeout = idle_timeout
+        self.last_active = time.monotonic()
+        self._entries: Dict[str, _Entry] = {}
+        self._entries_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._methods: Dict[str, Callable[..., Any]] = {
+            "list_dirs": self._list_dirs,
+            "cached_dirs": lambda e: e.dir_mngr.cached_dirs(),
+            "dirs": lambda e: list(e.dir_mngr.dirs),
+            "ignored_dirs": lambda e: list(e.dir_mngr.ignored_dirs),
+            "scan_status": lambda e: e.dir_mngr.scan_status(),
+        }
+        self._writes: Dict[str, Callable[..., Any]] = {
+            "add": lambda e, d: e.dir_mngr.add(d),
+            "add_dir": lambda e, d: e.dir_mngr._add(d),
+            "ignore": lambda e, d: e.dir_mngr.ignore(d),
+            "clear_added_dir": lambda e, d: e.dir_mngr.clear_added_dir(d),
+            "clear_added_dirs": lambda e: e.dir_mngr.clear_added_dirs(),
+            "clear_ignored_dir": lambda e, d: e.dir_mngr.clear_ignored_dir(d),
+            "clear_ignored_dirs": lambda e: e.dir_mngr.clear_ignored_dirs(),
+        }
+        super().__init__(path, _Handler)
+
+    def _entry(self, settings: Dict[str, Any]) -> _Entry:
+        key = json.dumps(settings, sort_keys=True)
+        with self._entries_lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(DirMngr(**settings))
+        entry.dir_mngr.reload_dirs()
+        return entry
+
+    def _list_dirs(self, entry: _Entry) -> List[str]:
+        requested = time.monotonic()
+        with entry.lock:
+            if entry.listed_at < requested:
+                entry.listed = entry.dir_mngr.list_dirs()
+                entry.listed_at = time.monotonic()
+            return entry.listed
+
+    def dispatch(self, request: Dict[str, Any]) -> Any:
+        """Result of a request."""
+        self.last_active = time.monotonic()
+        method = request.get("method")
+        if method == "ping":
+            return os.getpid()
+        if method == "shutdown":
+            return True
+        args = request.get("args", [])
+        if method in self._methods:
+            return self._methods[method](self._entry(request["settings"]), *args)
+        if method in self._writes:
+            with self._write_lock:
+                entry = self._entry(request["settings"])
+                return self._writes[method](entry, *args)
+        raise DaemonException("Unknown method: {!r}".format(method))
+
+    def _watchdog(self) -> None:
+        while True:
+            time.sleep(min(self.idle_timeout, 60))
+            if time.monotonic() - self.last_active > self.idle_timeout:
+                self.shutdown()
+                return
+
+    def serve(self) -> None:
+        """Serve until shut down, closing its dir managers afterwards."""
+        if self.idle_timeout:
+            threading.Thread(target=self._watchdog, daemon=True).start()
+        try:
+            self.serve_forever()
+        finally:
+            self.server_close()
+            for entry in self._entries.values():
+                entry.dir_mngr.close()
+
+
+def run(path: str, idle_timeout=3600.0) -> bool:
+    """Run the daemon on path until it's shut down, false if another one is
+    already running there."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".lock", "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        # the lock is held, so any socket left there is stale
+        if os.path.exists(path):
+            os.remove(path)
+        server = DaemonServer(path, idle_timeout)
+        try:
+            server.serve()
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+    return True
+
+
+class DaemonClient:
+
+    """Thin client of the index daemon, one connection per request. If
+    autostart, the daemon is started on the first request it's not there."""
+
+    def __init__(self, path: str, autostart=True, timeout=30.0) -> None:
+        """Constructor of DaemonClient."""
+        self.path = path
+        self.autostart = autostart
+        self.timeout = timeout
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def start(self, wait=5.0) -> None:
+        """Start the daemon in its own session and wait for its socket.
+        Raises DaemonException if it doesn't come up within wait seconds."""
+        package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(
+            p for p in (package_dir, env.get("PYTHONPATH")) if p
+        )
+        subprocess.Popen(
+            [sys.executable, "-m", "tmuxdir.daemon", "--socket", self.path],
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            try:
+                self._connect().close()
+                return
+            except OSError:
+                time.sleep(0.05)
+        raise DaemonException("tmuxdir daemon didn't start on " + self.path)
+
+    def call(
+        self, method: str, settings: Optional[Dict[str, Any]] = None, *args: Any
+    ) -> Any:
+        """Result of a request, raises DaemonException if it failed."""
+        try:
+            sock = self._connect()
+        except OSError:
+            if not self.autostart:
+                raise DaemonException("tmuxdir daemon isn't running on " + self.path)
+            self.start()
+            sock = self._connect()
+        request = {"method": method, "settings": settings or {}, "args": list(args)}
+        try:
+            with sock, sock.makefile("rwb") as f:
+                f.write(json.dumps(request).encode() + b"\n")
+                f.flush()
+                line = f.readline()
+        except OSError as e:
+            raise DaemonException("tmuxdir daemon request failed: {}".format(e))
+        if not line:
+            raise DaemonException("tmuxdir daemon closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise DaemonException(response["error"])
+        return response["result"]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="tmuxdir index daemon")
+    parser.add_argument("--socket", default=socket_path())
+    parser.add_argument("--idle-timeout", type=float, default=3600.0)
+    args = parser.parse_args(argv)
+    return 0 if run(args.socket, args.idle_timeout) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
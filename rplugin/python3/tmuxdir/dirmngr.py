@@ -1,21 +1,87 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import contextlib
+import itertools
 import os
 import pathlib
-from typing import Dict, List, Set
+import queue
+import re
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 from tmuxdir.config_handler import ConfigHandler
+from tmuxdir.gitmeta import GitMetaDiscovery
+from tmuxdir.markers import MarkerMatcher, RootMarker
+from tmuxdir.project_index import ProjectIndex
+from tmuxdir.scanner import ProjectScan, ProjectWalker
+from tmuxdir.stats import timed
+from tmuxdir.watcher import ProjectWatcher, start_watcher
 
 
 class ProjectDir:
 
-    """ProjectDir."""
+    """ProjectDir, an immutable project record.
 
-    def __init__(self, name: str, start_directory: str) -> None:
+    path is the absolute directory, dir its ~ relative display form, which
+    is what's listed and persisted, session_name the tmux session name of
+    dir and marker the root marker that matched, empty if it's unknown.
+    """
+
+    __slots__ = ("path", "dir", "session_name", "marker")
+
+    def __init__(self, path: str, dir: str, session_name: str, marker="") -> None:
         """Constructor of ProjectDir."""
 
-        self.name = name
-        self.start_directory = start_directory
+        self.path = path
+        self.dir = dir
+        self.session_name = session_name
+        self.marker = marker
+
+
+class ProjectStore:
+
+    """Interned ProjectDir records, keyed by their display dir.
+
+    Records are created once per project and shared by everything listing or
+    acting on projects, so listing them again doesn't allocate new strings.
+    """
+
+    def __init__(self) -> None:
+        """Constructor of ProjectStore."""
+        self._home = str(pathlib.Path.home())
+        self._records: Dict[str, ProjectDir] = {}
+
+    def display(self, path: str) -> str:
+        """~ relative form of an absolute path, if it's under home."""
+        if path == self._home or path.startswith(self._home + os.path.sep):
+            return "~" + path[len(self._home) :]
+        return path
+
+    @staticmethod
+    def session_name(dir_path: str) -> str:
+        """tmux session name of a dir, dots aren't allowed on them."""
+        return dir_path.replace(".", "-")
+
+    def _new(self, path: str, dir_path: str, marker: str) -> ProjectDir:
+        dir_path = sys.intern(dir_path)
+        record = ProjectDir(
+            sys.intern(path), dir_path, self.session_name(dir_path), marker
+        )
+        return self._records.setdefault(dir_path, record)
+
+    def add(self, path: str, marker="") -> ProjectDir:
+        """Record of an absolute project path."""
+        record = self._records.get(self.display(path))
+        return record if record else self._new(path, self.display(path), marker)
+
+    def get(self, dir_path: str) -> ProjectDir:
+        """Record of a display dir, either ~ relative or absolute."""
+        record = self._records.get(dir_path)
+        if record:
+            return record
+        return self._new(os.path.expanduser(dir_path), dir_path, "")
 
 
 class DirMngr:
@@ -25,117 +91,179 @@ class DirMngr:
     def __init__(
         self,
         base_dirs: List[str],
-        root_markers: List[str],
+        root_markers: List[RootMarker],
         eager_mode=False,
         cfg_handler: ConfigHandler = None,
+        scan_workers=1,
+        watch_mode="off",
+        exclude_patterns: List[str] = [],
+        stop_at_projects=False,
+        scan_budget_ms=0,
+        git_discovery=False,
     ) -> None:
         """Constructor of DirMngr."""
         self._base_dirs: List[str] = base_dirs
-        self._root_markers: List[str] = root_markers
-        self._session_dirs: Dict[str, ProjectDir] = {}
+        self._root_markers: List[RootMarker] = root_markers
+        self._matcher = MarkerMatcher(root_markers)
+        self.project_dirs = ProjectStore()
         self._eager_mode = eager_mode
+        self._scan_workers = scan_workers
+        self._exclude_patterns = exclude_patterns
+        self._stop_at_projects = stop_at_projects
+        self._scan_budget_ms = scan_budget_ms
+        self._scan: Optional[ProjectScan] = None
+        self._scan_lock = threading.Lock()
+        self.git_meta = GitMetaDiscovery() if git_discovery else None
 
         self._IGNORED_DIRS_KEY = "ignored_dirs"
         self._DIRS_KEY = "dirs"
 
         self.dirs: Dict[str, str] = {}
         self.ignored_dirs: Dict[str, str] = {}
+        self._pending_ops: List[Tuple[str, ...]] = []
+        self._defer_depth = 0
+        self._save_lock = threading.RLock()
 
         self.cfg_handler = cfg_handler if cfg_handler else ConfigHandler()
+        self.index = ProjectIndex(root_markers, cfg_handler=self.cfg_handler)
+        self.watcher: Optional[ProjectWatcher] = start_watcher(
+            watch_mode,
+            base_dirs,
+            root_markers,
+            eager=eager_mode,
+            exclude_patterns=exclude_patterns,
+            stop_at_projects=stop_at_projects,
+        )
 
         self._load_dirs()
 
+    def close(self) -> None:
+        """Stop the project watcher, if any."""
+        if self.watcher:
+            self.watcher.stop()
+
+    @timed("find_projects")
     def find_projects(
-        self, root_dir: str, root_markers: List[str], depth=3, eager=False
+        self,
+        root_dir: str,
+        root_markers: List[RootMarker],
+        depth=3,
+        eager=False,
+        cancelled: Optional[threading.Event] = None,
     ) -> List[str]:
         """Find project directories given a root_dir and the depth to go through,
-        if it's not eager it's going to return early."""
+        if it's not eager it's going to return early. The walk stops once
+        cancelled is set."""
+        return list(
+            self.iter_projects(root_dir, root_markers, depth, eager, cancelled)
+        )
 
-        dirs: List[str] = []
+    def iter_projects(
+        self,
+        root_dir: str,
+        root_markers: List[RootMarker],
+        depth=3,
+        eager=False,
+        cancelled: Optional[threading.Event] = None,
+    ) -> Iterator[str]:
+        """Generator version of find_projects, yielding projects as they're
+        found, shallower ones first."""
+
+        walker = ProjectWalker(
+            root_markers,
+            depth=depth,
+            eager=eager,
+            prune_dirs=list(self.ignored_dirs),
+            exclude_patterns=self._exclude_patterns,
+            stop_at_projects=self._stop_at_projects,
+        )
+        for d in walker.walk(root_dir, cancelled=cancelled):
+            yield self.project_dirs.add(d).dir
+
+    def reload_dirs(self) -> None:
+        """Reload persisted dirs if they've been changed by someone else."""
+        if self.cfg_handler.is_stale():
+            self._load_dirs()
+
+    @timed("_load_dirs")
+    def _load_dirs(self) -> None:
+        """Load persisted dirs, stale ones are pruned in the background."""
 
-        def _remove_path_sep(input_dir: str) -> str:
-            """Remove path separator."""
-            if input_dir[-1] == os.path.sep:
-                return input_dir[:-1]
-            return input_dir
+        dirs = self.cfg_handler.load()
+        if dirs:
+            self.dirs = dict(dirs.get(self._DIRS_KEY) or {})
+            self.ignored_dirs = dict(dirs.get(self._IGNORED_DIRS_KEY) or {})
+        if self.dirs or self.ignored_dirs:
+            threading.Thread(target=self.validate_dirs, daemon=True).start()
 
-        def _rec_find_projects(
-            dirs: List[str],
-            root_dir: str,
-            root_markers: List[str],
-            depth=3,
-            cur_depth=1,
-        ) -> List[str]:
-            """Recursively find projects."""
-            for marker in root_markers:
-                expr = "{}{}{}".format(
-                    (cur_depth - 1) * "*{}".format(os.path.sep), "*", marker
-                )
-                for d in pathlib.Path(os.path.expanduser(root_dir)).glob(expr):
-                    dirs.append(
-                        os.path.sep.join(
-                            str(d)
-                            .replace(str(pathlib.Path.home()), "~", 1)
-                            .split(os.path.sep)[:-1]
-                        )
-                    )
-            if cur_depth == depth:
-                return dirs
-            else:
-                if dirs and not eager:
-                    return dirs
-                return _rec_find_projects(
-                    dirs, root_dir, root_markers, depth, cur_depth + 1
-                )
-
-        return _rec_find_projects(dirs, _remove_path_sep(root_dir), root_markers, depth)
+    def validate_dirs(self, timeout=2.0) -> List[str]:
+        """Prune added and ignored dirs that don't exist anymore, stat'ing them
+        in parallel. Dirs that can't be stat'ed within timeout seconds, like
+        the ones on unresponsive mounts, are kept.
 
-    def _load_dirs(self) -> None:
-        """Load persisted dirs."""
+        Return the pruned dirs."""
 
-        def _get_non_existing_dirs(dirs: Dict[str, str]) -> Dict[str, str]:
-            return {k: k for k, _ in dirs.items() if not os.path.isdir(k)}
+        paths = set(itertools.chain(list(self.dirs), list(self.ignored_dirs)))
+        if not paths:
+            return []
+        stale = [
+            path for path, is_dir in _isdirs(paths, timeout).items() if not is_dir
+        ]
 
-        dirs = self.cfg_handler.load()
-        if dirs:
-            for key, attr in zip(
-                (
-                    self._DIRS_KEY,
-                    self._IGNORED_DIRS_KEY,
-                ),
-                ("dirs", "ignored_dirs"),
-            ):
-                if dirs.get(key):
-                    loaded_dirs = dirs[key]
-                    non_existing_loaded_dirs = _get_non_existing_dirs(loaded_dirs)
-                    load_dict = {
-                        k: v
-                        for k, v in loaded_dirs.items()
-                        if k not in non_existing_loaded_dirs
-                    }
-                    setattr(self, attr, load_dict)
-            self._save_dirs()
-
-    def _save_dirs(self) -> None:
-        """Save all dirs."""
-        dirs = {
-            self._DIRS_KEY: self.dirs,
-            self._IGNORED_DIRS_KEY: self.ignored_dirs,
-        }
-        self.cfg_handler.save(dirs=dirs)
-
-    def add(self, input_dir: str) -> List[str]:
-        """Add a project directory idempotently."""
+        with self.deferred_save():
+            for path in stale:
+                if self.dirs.pop(path, None):
+                    self._journal("pop", self._DIRS_KEY, path)
+                if self.ignored_dirs.pop(path, None):
+                    self._journal("pop", self._IGNORED_DIRS_KEY, path)
+        return stale
+
+    def _journal(self, *op: str) -> None:
+        """Persist an operation, unless saving is deferred."""
+        with self._save_lock:
+            self._pending_ops.append(op)
+            if not self._defer_depth:
+                self._flush()
+
+    @timed("_flush")
+    def _flush(self) -> None:
+        """Append pending operations to the config journal."""
+        with self._save_lock:
+            ops, self._pending_ops = self._pending_ops, []
+            if ops:
+                self.cfg_handler.append(ops)
+
+    @contextlib.contextmanager
+    def deferred_save(self) -> Iterator[None]:
+        """Coalesce the operations persisted within it into a single
+        journal append. Other threads' operations wait until it's done, so
+        nothing slow should run within it."""
+        with self._save_lock:
+            self._defer_depth += 1
+            try:
+                yield
+            finally:
+                self._defer_depth -= 1
+                if not self._defer_depth:
+                    self._flush()
+
+    def add(
+        self, input_dir: str, cancelled: Optional[threading.Event] = None
+    ) -> List[str]:
+        """Add the projects found under a directory idempotently. Nothing is
+        added once cancelled is set, the walk stops right away."""
 
         if input_dir in self.ignored_dirs:
             return []
 
-        return [
-            self._add(directory)
-            for directory in self.find_projects(
-                input_dir, self._root_markers, eager=self._eager_mode
-            )
-        ]
+        # walked before deferring, which blocks other threads' saves
+        projects = self.find_projects(
+            input_dir, self._root_markers, eager=self._eager_mode, cancelled=cancelled
+        )
+        if cancelled is not None and cancelled.is_set():
+            return []
+        with self.deferred_save():
+            return [self._add(directory) for directory in projects]
 
     def _add(self, input_dir: str) -> str:
         """Statically add a directory idempotently."""
@@ -144,20 +272,20 @@ class DirMngr:
             return input_dir
 
         self.dirs[input_dir] = input_dir
-        self._save_dirs()
+        self._journal("set", self._DIRS_KEY, input_dir)
         return input_dir
 
     def clear_added_dir(self, input_dir: str) -> bool:
         """Clear an added dir."""
         suceeded = bool(self.dirs.pop(input_dir, False))
         if suceeded:
-            self._save_dirs()
+            self._journal("pop", self._DIRS_KEY, input_dir)
         return suceeded
 
     def clear_added_dirs(self) -> bool:
         """Clear all added dirs."""
         self.dirs = {}
-        self._save_dirs()
+        self._journal("clear", self._DIRS_KEY)
         return True
 
     def ignore(self, input_dir: str) -> bool:
@@ -167,32 +295,214 @@ class DirMngr:
         if self.ignored_dirs.get(input_dir):
             return True
         self.ignored_dirs[input_dir] = input_dir
-        self._save_dirs()
+        self._journal("set", self._IGNORED_DIRS_KEY, input_dir)
         return True
 
     def clear_ignored_dir(self, input_dir: str) -> bool:
         """Clear an ignored dir."""
         suceeded = bool(self.ignored_dirs.pop(input_dir, False))
         if suceeded:
-            self._save_dirs()
+            self._journal("pop", self._IGNORED_DIRS_KEY, input_dir)
         return suceeded
 
     def clear_ignored_dirs(self) -> bool:
         """Clear all ignored dirs."""
         self.ignored_dirs = {}
-        self._save_dirs()
+        self._journal("clear", self._IGNORED_DIRS_KEY)
         return True
 
+    @timed("list_dirs")
     def list_dirs(self) -> List[str]:
         """Unique list non ignored directories based on root markers."""
+        return list(self.iter_dirs())
+
+    def iter_dirs(self) -> Iterator[str]:
+        """Generator version of list_dirs, yielding added dirs first and then
+        projects as they're found. The index is updated once it's exhausted.
+        Base dirs are walked by the background scan, joining the one already
+        running, if any, so concurrent listings share a single walk. With a
+        scan budget, projects are waited for that long at most."""
         dirs: Set[str] = set()
-        for d in self._base_dirs:
-            for walked_dir in self.find_projects(
-                d, self._root_markers, eager=self._eager_mode
-            ):
-                if not self.ignored_dirs.get(walked_dir):
-                    dirs.add(walked_dir)
-        for d in self.dirs:
-            if not self.ignored_dirs.get(d):
+        for d in list(self.dirs):
+            if not self.ignored_dirs.get(d) and d not in dirs:
                 dirs.add(d)
+                yield d
+
+        watched = self.watcher.dirs() if self.watcher else None
+        if watched is not None:
+            for watched_dir in watched:
+                record = self.project_dirs.get(watched_dir)
+                for d in self._with_git_projects(record, quick=True):
+                    if not self.ignored_dirs.get(d) and d not in dirs:
+                        dirs.add(d)
+                        yield d
+            return
+
+        budget = self._scan_budget_ms / 1000 if self._scan_budget_ms else None
+        for project in self._scanned_projects(budget):
+            if not self.ignored_dirs.get(project) and project not in dirs:
+                dirs.add(project)
+                yield project
+
+    def _walker(self) -> ProjectWalker:
+        return ProjectWalker(
+            self._matcher,
+            eager=self._eager_mode,
+            cache=self.index.dirs,
+            workers=self._scan_workers,
+            prune_dirs=list(self.ignored_dirs),
+            exclude_patterns=self._exclude_patterns,
+            stop_at_projects=self._stop_at_projects,
+        )
+
+    def _walk_base_dirs(self, walker: ProjectWalker) -> Iterator[str]:
+        """Yield the projects walked under base dirs, the index is updated
+        once it's exhausted."""
+        projects: List[str] = []
+        for walked_dir in walker.walk_many(self._base_dirs):
+            marker = self._matcher.marker(walker.visited[walked_dir][1])
+            for d in self._with_git_projects(self.project_dirs.add(walked_dir, marker)):
+                projects.append(d)
+                yield d
+        self.index.update(walker.visited, projects)
+
+    def _with_git_projects(self, record: ProjectDir, quick=False) -> Iterator[str]:
+        """Yield the dir of a project and then, with git discovery, the dirs
+        of its worktrees and submodules, see GitMetaDiscovery.discover for
+        quick."""
+        yield record.dir
+        if self.git_meta:
+            for path in self.git_meta.discover(record.path, quick):
+                yield self.project_dirs.add(path, ".git").dir
+
+    def scan(self) -> ProjectScan:
+        """Walk base dirs on a background thread, joining the walk already
+        running, if any."""
+        with self._scan_lock:
+            if self._scan is None or self._scan.done:
+                walker = self._walker()
+                self._scan = ProjectScan(walker, self._walk_base_dirs(walker)).start()
+            return self._scan
+
+    def scan_status(self) -> Dict[str, Any]:
+        """Progress of the last background walk, empty if there's none."""
+        return self._scan.status() if self._scan else {}
+
+    def _scanned_projects(self, budget: Optional[float] = None) -> Iterator[str]:
+        """Yield the projects found by the background walk, within budget
+        seconds if there's one. If the walk isn't done by then, it keeps
+        going and updates the index, while the projects of the last complete
+        walk are yielded instead of the missing ones."""
+        deadline = None if budget is None else time.monotonic() + budget
+        scan = self.scan()
+        seen = 0
+        while scan.wait(seen, deadline and deadline - time.monotonic()):
+            found = scan.projects[seen:]
+            seen += len(found)
+            yield from found
+            if scan.done and seen == len(scan.projects):
+                return
+        yield from self.index.projects
+
+    def cached_dirs(self) -> List[str]:
+        """Unique list non ignored directories known from the last scan,
+        without walking base dirs."""
+        dirs: Set[str] = set()
+        watched = self.watcher.dirs() if self.watcher else None
+        projects = self.index.projects if watched is None else watched
+        for d in itertools.chain(list(self.dirs), projects):
+            if not self.ignored_dirs.get(d):
+                dirs.add(self.project_dirs.get(d).dir)
         return list(dirs)
+
+
+# mounts with a stat stuck past its timeout, left unchecked until it returns
+_stuck_mounts: Set[str] = set()
+_stuck_lock = threading.Lock()
+
+
+def _mount_points() -> List[str]:
+    """Mount points, longest first, or [] if they can't be listed."""
+    try:
+        with open("/proc/mounts") as f:
+            fields = [line.split() for line in f]
+    except OSError:
+        return []
+    # whitespace and backslashes in mount points are octal escaped
+    points = {
+        re.sub(r"\\([0-7]{3})", lambda m: chr(int(m[1], 8)), field[1])
+        for field in fields
+        if len(field) > 1
+    }
+    return sorted(points, key=len, reverse=True)
+
+
+def _mount_of(path: str, points: List[str]) -> str:
+    """Longest mount point containing path, its first two components if mount
+    points aren't known."""
+    for point in points:
+        if path == point or path.startswith(point.rstrip(os.sep) + os.sep):
+            return point
+    return os.sep.join(path.split(os.sep)[:3])
+
+
+def _isdirs(paths: Set[str], timeout: float) -> Dict[str, bool]:
+    """os.path.isdir of ~ relative paths, stat'ed by a daemon thread per mount,
+    one after the other, each within timeout seconds of its start. Once a stat
+    is stuck, like on an unresponsive mount, the rest of its mount is left
+    unchecked, by this and later calls, until it returns, so a hung mount
+    holds at most one thread. Stuck threads don't block interpreter exit."""
+    points = _mount_points()
+    by_mount: Dict[str, List[str]] = {}
+    for path in paths:
+        mount = _mount_of(os.path.expanduser(path), points)
+        by_mount.setdefault(mount, []).append(path)
+    with _stuck_lock:
+        for mount in _stuck_mounts:
+            by_mount.pop(mount, None)
+
+    done: queue.Queue = queue.Queue()
+    started: Dict[str, float] = {}
+    abandoned: Set[str] = set()
+    finished: Set[str] = set()
+
+    def _worker(mount: str, mount_paths: List[str]) -> None:
+        for path in mount_paths:
+            if mount in abandoned:
+                break
+            started[mount] = time.monotonic()
+            try:
+                is_dir = os.path.isdir(os.path.expanduser(path))
+            except (OSError, ValueError):
+                is_dir = True
+            done.put((mount, path, is_dir))
+        with _stuck_lock:
+            finished.add(mount)
+            _stuck_mounts.discard(mount)
+        done.put((mount, None, None))
+
+    for mount, mount_paths in by_mount.items():
+        started[mount] = time.monotonic()
+        threading.Thread(target=_worker, args=(mount, mount_paths), daemon=True).start()
+    results: Dict[str, bool] = {}
+    running = set(by_mount)
+    while running:
+        wait = min(started[mount] for mount in running) + timeout - time.monotonic()
+        try:
+            mount, path, is_dir = done.get(timeout=max(wait, 0))
+        except queue.Empty:
+            now = time.monotonic()
+            for mount in [m for m in running if now - started[m] >= timeout]:
+                with _stuck_lock:
+                    if mount not in finished:
+                        _stuck_mounts.add(mount)
+                abandoned.add(mount)
+                running.discard(mount)
+            continue
+        if mount not in running:
+            continue
+        if path is None:
+            running.discard(mount)
+        else:
+            results[path] = is_dir
+    return results
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from tmuxdir.scanner import _RACY_MTIME_NS
+
+_SUBMODULE_PATH = re.compile(r"^\s*path\s*=\s*(.+?)\s*$", re.MULTILINE)
+
+# mtime_ns of every metadata file read, None if it's missing
+MetaKey = Tuple[Optional[int], ...]
+
+
+def _mtime_ns(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _settled(key: MetaKey) -> bool:
+    """Whether none of the mtimes of key are recent enough to still change
+    within the same mtime tick."""
+    now_ns = time.time() * 1e9
+    return all(mtime is None or now_ns - mtime >= _RACY_MTIME_NS for mtime in key)
+
+
+def _read(path: str) -> str:
+    try:
+        with open(path) as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError):
+        return ""
+
+
+class GitMetaDiscovery:
+
+    """Discover git worktrees and submodules of projects from git metadata.
+
+    Worktrees are read from .git/worktrees/*/gitdir, which points at the
+    .git file of each linked worktree, wherever it lives, and submodules
+    from the paths of .gitmodules, so no directory tree is walked. Only the
+    ones that exist are returned and submodules are looked into as well,
+    for nested submodules.
+
+    Results are cached per project, keyed on the mtimes of the metadata
+    files they were read from, so unchanged projects are only stat'ed. The
+    worktrees dir is stat'ed first and only listed again if its mtime
+    changed.
+    """
+
+    def __init__(self) -> None:
+        """Constructor of GitMetaDiscovery."""
+        self._cache: Dict[str, Tuple[MetaKey, List[str]]] = {}
+        # mtime of the worktrees dir of a project and its gitdir files
+        self._worktrees: Dict[str, Tuple[Optional[int], List[str]]] = {}
+        # top level key of a project and everything discovered from it
+        self._discovered: Dict[str, Tuple[MetaKey, List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def _top_key(self, project: str) -> MetaKey:
+        """Mtimes of the .gitmodules file and the worktrees dir of project."""
+        return (
+            _mtime_ns(os.path.join(project, ".gitmodules")),
+            _mtime_ns(os.path.join(project, ".git", "worktrees")),
+        )
+
+    def _gitdirs(self, project: str, worktrees_mtime: Optional[int]) -> List[str]:
+        """gitdir files of the worktrees of project, listed only if the
+        worktrees dir changed since it was last listed."""
+        with self._lock:
+            cached = self._worktrees.get(project)
+        if cached and cached[0] == worktrees_mtime:
+            return cached[1]
+        gitdirs: List[str] = []
+        if worktrees_mtime is not None:
+            try:
+                with os.scandir(os.path.join(project, ".git", "worktrees")) as it:
+                    gitdirs = sorted(os.path.join(e.path, "gitdir") for e in it)
+            except OSError:
+                pass
+        if _settled((worktrees_mtime,)):
+            with self._lock:
+                self._worktrees[project] = (worktrees_mtime, gitdirs)
+        return gitdirs
+
+    def _key(self, project: str) -> Tuple[MetaKey, List[str]]:
+        """Mtimes of the metadata files of project and the gitdir files of
+        its worktrees."""
+        top_key = self._top_key(project)
+        gitdirs = self._gitdirs(project, top_key[1])
+        return top_key + tuple(_mtime_ns(path) for path in gitdirs), gitdirs
+
+    def _read_project(self, project: str, gitdirs: List[str]) -> List[str]:
+        found: List[str] = []
+        for gitdir in gitdirs:
+            dot_git = _read(gitdir).strip()
+            if dot_git:
+                dot_git = os.path.join(os.path.dirname(gitdir), dot_git)
+                found.append(os.path.dirname(os.path.normpath(dot_git)))
+        modules = _read(os.path.join(project, ".gitmodules"))
+        for path in _SUBMODULE_PATH.findall(modules):
+            found.append(os.path.normpath(os.path.join(project, path)))
+        return [path for path in found if os.path.isdir(path)]
+
+    def project(self, project: str) -> List[str]:
+        """Worktrees and submodules of a single project, not nested ones."""
+        key, gitdirs = self._key(project)
+        with self._lock:
+            cached = self._cache.get(project)
+        if cached and cached[0] == key:
+            return cached[1]
+        found = self._read_project(project, gitdirs)
+        with self._lock:
+            self._cache[project] = (key, found)
+        return found
+
+    def discover(self, project: str, quick=False) -> List[str]:
+        """Absolute worktrees and submodules of project, nested ones
+        included, project being an absolute directory.
+
+        If quick, the last result is reused as long as the .gitmodules file
+        and the worktrees dir of project itself are unchanged, which takes
+        two stats, instead of checking every metadata file."""
+        if quick:
+            top_key = self._top_key(project)
+            with self._lock:
+                cached = self._discovered.get(project)
+            if cached and cached[0] == top_key:
+                return cached[1]
+        found = self._discover(project)
+        if quick and _settled(top_key):
+            with self._lock:
+                self._discovered[project] = (top_key, found)
+        return found
+
+    def _discover(self, project: str) -> List[str]:
+        found: List[str] = []
+        seen = {project}
+        pending = [project]
+        while pending:
+            for path in self.project(pending.pop()):
+                if path not in seen:
+                    seen.add(path)
+                    found.append(path)
+                    pending.append(path)
+        return found
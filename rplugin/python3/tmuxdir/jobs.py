@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import itertools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from pynvim import Nvim
+from tmuxdir.stats import STATS
+
+JOB_DONE_EVENT = "TmuxdirJobDone"
+
+
+class Job:
+
+    """A plugin function running on the job worker."""
+
+    __slots__ = ("id", "name", "callback", "cancelled", "future")
+
+    def __init__(self, job_id: int, name: str, callback="") -> None:
+        """Constructor of Job."""
+        self.id = job_id
+        self.name = name
+        self.callback = callback
+        self.cancelled = threading.Event()
+        self.future: Optional[Future] = None
+
+    def report(self, result: Any = None, error="") -> Dict[str, Any]:
+        """Job report as passed to vim."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "result": result,
+            "error": error,
+            "cancelled": self.cancelled.is_set(),
+        }
+
+
+class JobRunner:
+
+    """Run plugin functions as jobs on a worker thread, so nvim isn't blocked.
+
+    Jobs run one at a time, in submission order. Once a job is done, its
+    report, a dict with its id, name, result, error and whether it was
+    cancelled, is set as g:tmuxdir_job on the nvim event loop, its callback,
+    if any, is called with it and the User TmuxdirJobDone autocmd is fired.
+
+    A job's function is passed the job's cancelled Event, which it may
+    check to stop early. A job that's cancelled before its function starts
+    never runs. Once started, it's only stopped if its function checks the
+    Event, otherwise it still takes effect, but either way it's reported as
+    cancelled and without its result.
+    """
+
+    def __init__(self, nvim: Nvim) -> None:
+        """Constructor of JobRunner."""
+        self.nvim = nvim
+        self._ids = itertools.count(1)
+        self._jobs: Dict[int, Job] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(1)
+
+    def submit(
+        self, name: str, fn: Callable[[threading.Event], Any], callback=""
+    ) -> int:
+        """Run fn as a job, callback being the name of a vim function.
+        Return the job id."""
+        job = Job(next(self._ids), name, callback)
+        with self._lock:
+            self._jobs[job.id] = job
+            job.future = self._pool.submit(self._run, job, fn)
+        return job.id
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a job, False if it's unknown or already done."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return False
+            job.cancelled.set()
+            if job.future and job.future.cancel():
+                self._jobs.pop(job_id)
+                self.nvim.async_call(self._done, job.report(), job.callback)
+        return True
+
+    def pending(self) -> Dict[int, str]:
+        """Names of the jobs that aren't done yet, by id."""
+        with self._lock:
+            return {job_id: job.name for job_id, job in self._jobs.items()}
+
+    def _run(self, job: Job, fn: Callable[[threading.Event], Any]) -> None:
+        result, error = None, ""
+        # it may have been cancelled once picked up by the worker
+        if not job.cancelled.is_set():
+            try:
+                with STATS.span(job.name + "Async"):
+                    result = fn(job.cancelled)
+            except Exception as e:
+                error = str(e)
+        with self._lock:
+            self._jobs.pop(job.id, None)
+        if job.cancelled.is_set():
+            result, error = None, ""
+        self.nvim.async_call(self._done, job.report(result, error), job.callback)
+
+    def _done(self, report: Dict[str, Any], callback="") -> None:
+        """Report a job on the nvim event loop."""
+        self.nvim.vars["tmuxdir_job"] = report
+        if callback:
+            self.nvim.call(callback, report)
+        self.nvim.command(
+            "if exists('#User#{0}') | doautocmd <nomodeline> User {0} | endif".format(
+                JOB_DONE_EVENT
+            )
+        )
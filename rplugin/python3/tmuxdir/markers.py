@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import fnmatch
+import re
+from typing import Any, Dict, Iterable, List, Pattern, Tuple, Union
+
+# a root marker is either an entry name suffix or glob, or a rule dict like
+# {'name': 'pyproject.toml', 'without': ['setup.py'], 'not_inside': ['.git']}
+# whose names are exact or globs
+RootMarker = Union[str, Dict[str, Any]]
+
+_GLOB_CHARS = re.compile(r"[*?[]")
+
+
+class MarkerException(Exception):
+    def __init__(self, msg: str):
+        super().__init__(msg)
+        self.msg = msg
+
+    def __repr__(self) -> str:
+        return self.msg
+
+
+class MarkerMatcher:
+
+    """Root markers compiled once to be tested against entry names.
+
+    Every name used by any marker is a term with its own bit. Listing a
+    directory ORs the terms matched by each of its entries into a single
+    flags int, exact names being a dict lookup, suffixes a single endswith
+    and globs a single regex test, and then is_project evaluates all markers
+    against the flags.
+
+    A plain marker that isn't a glob is matched as a suffix, as it always
+    was, so '.git' matches 'bare.git' too. Names of rule dicts are exact.
+
+    A rule dict is a project if an entry matches 'name', entries match all of
+    its 'with' names, none of its 'without' names, and no ancestor directory
+    walked through has an entry matching its 'not_inside' names.
+    """
+
+    def __init__(self, root_markers: Iterable[RootMarker]) -> None:
+        """Constructor of MarkerMatcher.
+        Raises MarkerException if a marker isn't valid."""
+        self.root_markers = list(root_markers)
+        self._exact: Dict[str, int] = {}
+        self._suffixes: List[Tuple[str, int]] = []
+        self._globs: List[Tuple[Pattern, int]] = []
+        self._terms: Dict[Tuple[str, bool], int] = {}
+        # (name, with, without, not_inside) term masks of each marker
+        self._rules: List[Tuple[int, int, int, int]] = []
+        for marker in self.root_markers:
+            self._rules.append(self._compile(marker))
+        self._simple = 0
+        for name, with_mask, without_mask, not_inside in self._rules:
+            if not (with_mask or without_mask or not_inside):
+                self._simple |= name
+        self._suffix_any = tuple(suffix for suffix, _ in self._suffixes)
+        self._glob_any = (
+            re.compile("|".join(p.pattern for p, _ in self._globs))
+            if self._globs
+            else None
+        )
+        self.needs_ancestors = any(rule[3] for rule in self._rules)
+
+    def __bool__(self) -> bool:
+        return bool(self._rules)
+
+    def _term(self, name: str, suffix=False) -> int:
+        """Bit of a name term, allocating it if it's new. If suffix, a name
+        that isn't a glob matches the entry names ending with it."""
+        if not isinstance(name, str) or not name:
+            raise MarkerException("Invalid root marker name: {!r}".format(name))
+        is_glob = bool(_GLOB_CHARS.search(name))
+        key = (name, suffix and not is_glob)
+        bit = self._terms.get(key)
+        if bit:
+            return bit
+        bit = self._terms[key] = 1 << len(self._terms)
+        if is_glob:
+            self._globs.append((re.compile(fnmatch.translate(name)), bit))
+        elif suffix:
+            self._suffixes.append((name, bit))
+        else:
+            self._exact[name] = bit
+        return bit
+
+    def _mask(self, names: Iterable[str]) -> int:
+        mask = 0
+        for name in names:
+            mask |= self._term(name)
+        return mask
+
+    def _compile(self, marker: RootMarker) -> Tuple[int, int, int, int]:
+        if isinstance(marker, str):
+            return self._term(marker, suffix=True), 0, 0, 0
+        if not isinstance(marker, dict) or "name" not in marker:
+            raise MarkerException("Invalid root marker: {!r}".format(marker))
+        return (
+            self._term(marker["name"]),
+            self._mask(marker.get("with", [])),
+            self._mask(marker.get("without", [])),
+            self._mask(marker.get("not_inside", [])),
+        )
+
+    def flags(self, name: str) -> int:
+        """Terms matched by an entry name."""
+        flags = self._exact.get(name, 0)
+        if self._suffix_any and name.endswith(self._suffix_any):
+            for suffix, bit in self._suffixes:
+                if name.endswith(suffix):
+                    flags |= bit
+        if self._glob_any and self._glob_any.match(name):
+            for pattern, bit in self._globs:
+                if pattern.match(name):
+                    flags |= bit
+        return flags
+
+    def marker(self, flags: int) -> str:
+        """Name of the first marker matched by flags, empty if none is."""
+        for marker, rule in zip(self.root_markers, self._rules):
+            if flags & rule[0]:
+                return marker if isinstance(marker, str) else marker["name"]
+        return ""
+
+    def is_project(self, flags: int, inherited=0) -> bool:
+        """Whether a directory whose entries matched flags is a project,
+        inherited being the flags of its ancestors ORed together."""
+        if flags & self._simple:
+            return True
+        if not flags:
+            return False
+        for name, with_mask, without_mask, not_inside in self._rules:
+            if (
+                flags & name
+                and flags & with_mask == with_mask
+                and not flags & without_mask
+                and not inherited & not_inside
+            ):
+                return True
+        return False
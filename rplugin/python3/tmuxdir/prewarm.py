@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import pickle
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from tmuxdir.config_handler import ConfigHandler
+from tmuxdir.tmux_session_facade import (
+    PREWARM_OPTION,
+    TmuxBatch,
+    TmuxFacadeException,
+)
+
+
+def rss_mb(pid: int) -> float:
+    """Resident memory of a process in MB, 0 if it can't be read, which is
+    always the case outside of Linux."""
+    try:
+        with open("/proc/{}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0.0
+
+
+class SessionPrewarmer:
+
+    """Keep detached sessions ready for the most opened projects.
+
+    Opens are counted per project dir and persisted next to the dirs config.
+    Up to pool_size of the most opened projects without a session get a
+    detached session in the background, marked with the @tmuxdir_prewarm
+    session option, so opening them is just a switch-client. Once a
+    pre-warmed session is opened it's claimed, unmarked, and becomes a
+    regular session. Sessions a client ever attached to are claimed as well,
+    however they were opened, so one that's being edited in is never killed.
+
+    Pre-warmed sessions that aren't opened within idle_timeout seconds are
+    killed, and aren't pre-warmed again until their project is opened. No
+    new ones are started if pre-warmed editors would use more than
+    memory_budget_mb of resident memory. A fresh editor is still starting
+    when it's created, so it's estimated to use as much as the already warm
+    ones, and if there are none, a single one is started per pass so it's
+    measured on the next one.
+    """
+
+    def __init__(
+        self,
+        tmux_dir,
+        pool_size=3,
+        idle_timeout=1800.0,
+        memory_budget_mb=1024.0,
+        vim_bin_path="nvim",
+    ) -> None:
+        """Constructor of SessionPrewarmer."""
+        self._tmux_dir = tmux_dir
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.memory_budget_mb = memory_budget_mb
+        self.vim_bin_path = vim_bin_path
+        self.vim_args = "e ."
+
+        self._COUNTS_KEY = "counts"
+        self.cfg_handler = ConfigHandler(
+            file_name="usage.pickle", folder_name=tmux_dir.cfg_handler._folder
+        )
+        try:
+            usage = self.cfg_handler.load()
+        except (OSError, EOFError, pickle.UnpicklingError):
+            usage = {}
+        self.counts: Dict[str, int] = usage.get(self._COUNTS_KEY, {})
+        # expired dirs aren't pre-warmed again until they're opened
+        self._expired: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record_open(self, dir_path: str, vim_bin_path: Optional[str] = None) -> None:
+        """Count an open of dir_path and pre-warm in the background."""
+        self.counts[dir_path] = self.counts.get(dir_path, 0) + 1
+        self._expired.pop(dir_path, None)
+        if vim_bin_path:
+            self.vim_bin_path = vim_bin_path
+        try:
+            self.cfg_handler.save({self._COUNTS_KEY: self.counts})
+        except OSError:
+            pass
+        self.schedule()
+
+    def schedule(self) -> None:
+        """Pre-warm in a daemon thread, it returns right away if another one
+        is already pre-warming."""
+        threading.Thread(target=self.warm, daemon=True).start()
+
+    def claim(self, batch: TmuxBatch, session_name: str) -> None:
+        """Add unmarking session_name on batch if it's pre-warmed."""
+        session = self._tmux_dir.sessions().get(session_name)
+        if session and session.prewarmed:
+            batch.add(["tmux", "set-option", "-u", "-t", session_name, PREWARM_OPTION])
+
+    def top_dirs(self) -> List[str]:
+        """Up to pool_size of the most opened dirs that may be pre-warmed."""
+        ranked = sorted(list(self.counts.items()), key=lambda x: x[1], reverse=True)
+        return [d for d, _ in ranked if d not in self._expired][: self.pool_size]
+
+    def warm(self) -> Tuple[List[str], List[str]]:
+        """Kill expired pre-warmed sessions and pre-warm the top dirs.
+
+        Return the names of the sessions started and killed."""
+        started: List[str] = []
+        killed: List[str] = []
+        if not self._lock.acquire(blocking=False):
+            return started, killed
+        try:
+            tmux_dir = self._tmux_dir
+            now = time.time()
+            top = self.top_dirs()
+            wanted = {tmux_dir.dir_to_session_name(d): d for d in top}
+            batch = tmux_dir.batch()
+            warm_mb: List[float] = []
+            claimed = False
+            for name, session in tmux_dir.refresh().items():
+                if not session.prewarmed:
+                    continue
+                if session.attached or session.last_attached:
+                    self.claim(batch, name)
+                    claimed = True
+                    continue
+                if now - session.prewarmed > self.idle_timeout:
+                    self._expired[tmux_dir.project_dirs.display(session.path)] = now
+                elif name in wanted:
+                    warm_mb.append(rss_mb(session.pid))
+                    continue
+                batch.kill(name)
+                killed.append(name)
+            if killed or claimed:
+                batch.run()
+            memory_mb = sum(warm_mb)
+            estimate_mb = memory_mb / len(warm_mb) if warm_mb else 0.0
+
+            index = tmux_dir.session_index()
+            for name, dir_path in wanted.items():
+                if dir_path in self._expired or index.dir_sessions(dir_path):
+                    continue
+                if self.memory_budget_mb and (
+                    memory_mb >= self.memory_budget_mb
+                    or memory_mb + estimate_mb > self.memory_budget_mb
+                ):
+                    break
+                start_directory = os.path.expanduser(dir_path)
+                if not os.path.isdir(start_directory):
+                    continue
+                mark = ["tmux", "set-option", "-t", name, PREWARM_OPTION, str(int(now))]
+                errors = (
+                    tmux_dir.batch()
+                    .create(name, self.vim_bin_path, start_directory, self.vim_args)
+                    .add(mark)
+                    .run()
+                )
+                if not errors[0]:
+                    started.append(name)
+                    memory_mb += estimate_mb
+                    if self.memory_budget_mb and not estimate_mb:
+                        break
+        except TmuxFacadeException:
+            pass
+        finally:
+            self._lock.release()
+        return started, killed
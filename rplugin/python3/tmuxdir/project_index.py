@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pickle
+from typing import Dict, List
+from tmuxdir.config_handler import ConfigHandler
+from tmuxdir.markers import RootMarker
+from tmuxdir.scanner import DirStat
+
+
+class ProjectIndex:
+
+    """Persistent project index, stored next to the dirs config file.
+
+    It keeps the projects found on the last scan and the stat of every
+    directory visited, so the next scan only lists directories whose mtime
+    changed. Since the marker flags of a directory stat depend on the root
+    markers, the index is discarded when they, or its version, change.
+    """
+
+    VERSION = 3
+
+    def __init__(
+        self, root_markers: List[RootMarker], cfg_handler: ConfigHandler = None
+    ) -> None:
+        """Constructor of ProjectIndex."""
+        self._VERSION_KEY = "version"
+        self._ROOT_MARKERS_KEY = "root_markers"
+        self._DIRS_KEY = "dirs"
+        self._PROJECTS_KEY = "projects"
+
+        self.root_markers = list(root_markers)
+        self.dirs: Dict[str, DirStat] = {}
+        self.projects: List[str] = []
+
+        folder_name = cfg_handler._folder if cfg_handler else "~/.config/tmuxdir"
+        self.cfg_handler = ConfigHandler(
+            file_name="index.pickle", folder_name=folder_name
+        )
+        self._load()
+
+    def _load(self) -> None:
+        """Load the persisted index, discarding it if root markers changed."""
+        try:
+            index = self.cfg_handler.load()
+        except (OSError, EOFError, pickle.UnpicklingError):
+            index = {}
+        if (
+            not index
+            or index.get(self._VERSION_KEY) != self.VERSION
+            or index.get(self._ROOT_MARKERS_KEY) != self.root_markers
+        ):
+            return
+        self.dirs = index.get(self._DIRS_KEY, {})
+        self.projects = index.get(self._PROJECTS_KEY, [])
+
+    def update(self, dirs: Dict[str, DirStat], projects: List[str]) -> bool:
+        """Replace the indexed dirs and projects, saving only if they changed.
+
+        Return true if it has been saved, false otherwise."""
+        if dirs == self.dirs and projects == self.projects:
+            return False
+        self.dirs = dirs
+        self.projects = projects
+        self.cfg_handler.save(
+            {
+                self._VERSION_KEY: self.VERSION,
+                self._ROOT_MARKERS_KEY: self.root_markers,
+                self._DIRS_KEY: self.dirs,
+                self._PROJECTS_KEY: self.projects,
+            }
+        )
+        return True
+
+    def clear(self) -> None:
+        """Clear the index."""
+        self.update({}, [])
@@ -1,12 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import threading
 import pynvim as nvim
 
-from tmuxdir.tmuxdir_facade import TmuxDirFacade, TmuxFacadeException
-from tmuxdir.dirmngr import DirMngr
-from tmuxdir.util import expanduser_raise_if_not_dir, echoerr
-from typing import List
+from tmuxdir.jobs import JobRunner
+from tmuxdir.tmuxdir_facade import TmuxDirFacade
+from tmuxdir.util import expanduser_raise_if_not_dir
+from typing import Any, Callable, List
 
 
 class TmuxDirPlugin:
@@ -17,23 +18,33 @@ class TmuxDirPlugin:
         """Constructor of TmuxDirPlugin."""
         self.nvim = nvim
         self.plugin_name = "tmuxdir"
-
-        # nvim settings
-        self.root_markers: List[str] = self.nvim.eval("TmuxdirRootMarkers()")
-        self.base_dirs: List[str] = self.nvim.eval("TmuxdirBaseDirs()")
-        self._eager_mode: bool = self.nvim.eval("TmuxdirEagerMode()")
-
-        self.dir_mngr = DirMngr(
-            base_dirs=self.base_dirs,
-            root_markers=self.root_markers,
-            eager_mode=self._eager_mode,
-        )
-
-        self.tmux_dir = TmuxDirFacade(self.base_dirs, self.root_markers)
-        try:
-            self.tmux_dir._check_tmux_bin()
-        except TmuxFacadeException as e:
-            echoerr(self.nvim, str(e), self.plugin_name)
+        self.jobs = JobRunner(nvim)
+
+    @property
+    def tmux_dir(self) -> TmuxDirFacade:
+        """Shared TmuxDirFacade, built on first use or if settings change."""
+        return TmuxDirFacade.instance(self.nvim.eval("TmuxdirSettings()"))
+
+    def submit(
+        self,
+        name: str,
+        fn: Callable[..., Any],
+        args: List,
+        callback="",
+        cancellable=False,
+    ) -> int:
+        """Run fn(tmux_dir, *args) as a job, return its id. Settings are read
+        right away, since nvim can't be called from the job worker. If
+        cancellable, the job's cancelled Event is passed as cancelled too."""
+        settings = self.nvim.eval("TmuxdirSettings()")
+
+        def _job(cancelled: threading.Event) -> Any:
+            tmux_dir = TmuxDirFacade.instance(settings)
+            if cancellable:
+                return fn(tmux_dir, *args, cancelled=cancelled)
+            return fn(tmux_dir, *args)
+
+        return self.jobs.submit(name, _job, callback)
 
     def tmuxdir_add(self, args: List) -> List[str]:
         root_dir = expanduser_raise_if_not_dir(args[0])
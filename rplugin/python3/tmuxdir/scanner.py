@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import fnmatch
+import os
+import pathlib
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Pattern,
+    Tuple,
+    Union,
+)
+from tmuxdir.markers import MarkerMatcher, RootMarker
+
+# (mtime_ns, marker flags, sub_dirs) of a listed directory, see MarkerMatcher
+DirStat = Tuple[Optional[int], int, Tuple[str, ...]]
+
+# a directory modified this recently can still change within the same mtime
+# tick, so it's re-listed on the next walk instead of trusted.
+_RACY_MTIME_NS = 1_000_000_000
+
+
+class ProjectWalker:
+
+    """Single pass os.scandir based project walker.
+
+    Directories are visited breadth first, one level at a time, and each
+    directory is listed exactly once, matching its entries against the
+    compiled root markers. The depth level of the root_dir itself is 1.
+
+    If a cache is given, a directory whose mtime hasn't changed since it was
+    cached is stat'ed instead of listed. Every directory visited is recorded
+    in visited, which can be used as the cache of the next walk.
+
+    With more than one worker, the directories of each depth level, across
+    all root dirs and their sub trees, are scanned by a thread pool.
+
+    Sub trees are pruned as the walk goes: the ones of prune_dirs, absolute
+    or ~ relative, the ones whose name or path matches any of the
+    exclude_patterns globs and, with stop_at_projects, the ones below a
+    project. Root dirs themselves are never pruned.
+    """
+
+    def __init__(
+        self,
+        root_markers: Union[List[RootMarker], MarkerMatcher],
+        depth=3,
+        eager=False,
+        cache: Optional[Dict[str, DirStat]] = None,
+        workers=1,
+        prune_dirs: Iterable[str] = (),
+        exclude_patterns: Iterable[str] = (),
+        stop_at_projects=False,
+    ) -> None:
+        """Constructor of ProjectWalker."""
+        self.matcher = (
+            root_markers
+            if isinstance(root_markers, MarkerMatcher)
+            else MarkerMatcher(root_markers)
+        )
+        self.depth = depth
+        self.eager = eager
+        self.cache = cache
+        self.workers = workers
+        self.prune_dirs = {
+            os.path.normpath(os.path.expanduser(d)) for d in prune_dirs
+        }
+        self.exclude = compile_patterns(exclude_patterns)
+        self.stop_at_projects = stop_at_projects
+        self.visited: Dict[str, DirStat] = {}
+        self.misses = 0
+        # progress of the walk: depth levels done, dirs scanned and dirs
+        # still to be scanned on the current level
+        self.levels_done = 0
+        self.scanned = 0
+        self.pending = 0
+
+    def _scan(self, dir_path: str) -> DirStat:
+        """Scan a directory, returning its mtime, the marker flags of its
+        entries and its sub directories."""
+        if self.cache is None:
+            return (None,) + self._list(dir_path)
+        try:
+            mtime_ns: Optional[int] = os.stat(dir_path).st_mtime_ns
+        except OSError:
+            return None, 0, ()
+        cached = self.cache.get(dir_path)
+        if cached and cached[0] is not None and cached[0] == mtime_ns:
+            return cached
+
+        flags, sub_dirs = self._list(dir_path)
+        if time.time() * 1e9 - mtime_ns < _RACY_MTIME_NS:
+            mtime_ns = None
+        return mtime_ns, flags, sub_dirs
+
+    def _list(self, dir_path: str) -> Tuple[int, Tuple[str, ...]]:
+        """List a directory once, returning the marker flags of its entries
+        and its sub directories."""
+        flags = 0
+        match = self.matcher.flags
+        sub_dirs: List[str] = []
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    flags |= match(entry.name)
+                    try:
+                        if entry.is_dir():
+                            sub_dirs.append(entry.path)
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+        return flags, tuple(sub_dirs)
+
+    def _pruned(self, dir_path: str) -> bool:
+        """Whether the sub tree of dir_path shouldn't be walked."""
+        if dir_path in self.prune_dirs:
+            return True
+        return bool(
+            self.exclude
+            and (
+                self.exclude.match(os.path.basename(dir_path))
+                or self.exclude.match(dir_path)
+            )
+        )
+
+    def _record(self, dir_path: str, stat: DirStat) -> None:
+        """Record a scanned directory on visited."""
+        if self.cache is None:
+            return
+        if stat is not self.cache.get(dir_path):
+            self.misses += 1
+        self.visited[dir_path] = stat
+
+    def walk(
+        self,
+        root_dir: str,
+        inherited=0,
+        cancelled: Optional[threading.Event] = None,
+    ) -> Iterator[str]:
+        """Yield absolute project directories found under root_dir, if it's not
+        eager it stops at the first depth level with projects."""
+        return self.walk_many([root_dir], inherited, cancelled)
+
+    def walk_many(
+        self,
+        root_dirs: List[str],
+        inherited=0,
+        cancelled: Optional[threading.Event] = None,
+    ) -> Iterator[str]:
+        """Yield absolute project directories found under each of root_dirs,
+        depth and eager apply to each root dir independently. inherited are
+        the marker flags of the ancestors of root_dirs. The walk stops
+        between directories once cancelled is set."""
+        if not self.matcher:
+            return
+        levels: Dict[int, List[Tuple[str, int]]] = {
+            i: [(str(pathlib.Path(os.path.expanduser(root_dir))), inherited)]
+            for i, root_dir in enumerate(root_dirs)
+        }
+        is_project = self.matcher.is_project
+        needs_ancestors = self.matcher.needs_ancestors
+        found = set()
+        pool = ThreadPoolExecutor(self.workers) if self.workers > 1 else None
+        try:
+            for cur_depth in range(1, self.depth + 1):
+                batch = [(i, d) for i, dirs in levels.items() for d in dirs]
+                paths = [dir_path for _, (dir_path, _) in batch]
+                self.pending = len(paths)
+                stats = pool.map(self._scan, paths) if pool else map(self._scan, paths)
+                next_levels: Dict[int, List[Tuple[str, int]]] = {}
+                for (i, (dir_path, flags)), stat in zip(batch, stats):
+                    if cancelled is not None and cancelled.is_set():
+                        return
+                    self._record(dir_path, stat)
+                    self.scanned += 1
+                    self.pending -= 1
+                    if stat[1] and is_project(stat[1], flags):
+                        found.add(i)
+                        yield dir_path
+                        if self.stop_at_projects:
+                            continue
+                    if cur_depth < self.depth and stat[2]:
+                        sub_dirs = stat[2]
+                        if self.prune_dirs or self.exclude:
+                            sub_dirs = [d for d in sub_dirs if not self._pruned(d)]
+                        flags = flags | stat[1] if needs_ancestors else 0
+                        next_levels.setdefault(i, []).extend(
+                            (d, flags) for d in sub_dirs
+                        )
+                self.levels_done = cur_depth
+                levels = {
+                    i: dirs
+                    for i, dirs in next_levels.items()
+                    if self.eager or i not in found
+                }
+                if not levels:
+                    return
+        finally:
+            if pool:
+                pool.shutdown(wait=False)
+
+
+class ProjectScan:
+
+    """A project walk running on its own thread.
+
+    Projects are appended to projects as the walk yields them, shallower
+    ones first, and done is set once it's exhausted. Consumers can wait for
+    new projects with a timeout instead of blocking on the whole walk.
+    """
+
+    def __init__(self, walker: ProjectWalker, projects: Iterator[str]) -> None:
+        """Constructor of ProjectScan."""
+        self.walker = walker
+        self.projects: List[str] = []
+        self.done = False
+        self.error = ""
+        self._projects = projects
+        self._started = time.monotonic()
+        self._finished: Optional[float] = None
+        self._cond = threading.Condition()
+
+    def start(self) -> "ProjectScan":
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def _run(self) -> None:
+        try:
+            for project in self._projects:
+                with self._cond:
+                    self.projects.append(project)
+                    self._cond.notify_all()
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            with self._cond:
+                self.done = True
+                self._finished = time.monotonic()
+                self._cond.notify_all()
+
+    def wait(self, seen: int, timeout: Optional[float] = None) -> bool:
+        """Wait up to timeout seconds, forever if it's None, for more than
+        seen projects to be found or for the walk to be done. Return false if
+        it timed out."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: len(self.projects) > seen or self.done,
+                None if timeout is None else max(timeout, 0),
+            )
+
+    def status(self) -> Dict[str, Any]:
+        """Progress of the walk, coverage being the fraction of depth levels
+        fully walked, 1 once it's done."""
+        walker = self.walker
+        end = self._finished or time.monotonic()
+        return {
+            "running": not self.done,
+            "elapsed_ms": (end - self._started) * 1000,
+            "depth": walker.levels_done,
+            "max_depth": walker.depth,
+            "scanned": walker.scanned,
+            "pending": walker.pending,
+            "projects": len(self.projects),
+            "coverage": 1.0 if self.done else walker.levels_done / walker.depth,
+            "error": self.error,
+        }
+
+
+def compile_patterns(patterns: Iterable[str]) -> Optional[Pattern]:
+    """Compile glob patterns, ~ expanded, into a single regex, None if there
+    are no patterns."""
+    patterns = [os.path.expanduser(p) for p in patterns]
+    if not patterns:
+        return None
+    return re.compile("|".join(fnmatch.translate(p) for p in patterns))
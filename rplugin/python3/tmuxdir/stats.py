@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import contextlib
+import functools
+import json
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Optional, TextIO
+
+
+class SpanStats:
+
+    """Timings of a span, the last max_samples durations are kept to compute
+    percentiles."""
+
+    def __init__(self, max_samples=1024) -> None:
+        """Constructor of SpanStats."""
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = collections.deque(maxlen=max_samples)
+
+    def add(self, duration: float) -> None:
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.samples.append(duration)
+
+    def summary(self) -> Dict[str, float]:
+        """count and total, p50, p95 and max durations in ms."""
+        samples = sorted(self.samples)
+
+        def _percentile(p: float) -> float:
+            return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "p50_ms": _percentile(0.5),
+            "p95_ms": _percentile(0.95),
+            "max_ms": self.max * 1000,
+        }
+
+
+class Stats:
+
+    """Collect timing spans, optionally tracing them as JSON lines.
+
+    While it's disabled, spans don't measure anything.
+    """
+
+    def __init__(self) -> None:
+        """Constructor of Stats."""
+        self.enabled = False
+        self._spans: Dict[str, SpanStats] = {}
+        self._lock = threading.Lock()
+        self._trace_path = ""
+        self._trace: Optional[TextIO] = None
+
+    def configure(self, enabled: bool, trace_file="") -> None:
+        """Enable or disable spans, tracing them to trace_file if it's set."""
+        with self._lock:
+            if trace_file != self._trace_path:
+                if self._trace:
+                    self._trace.close()
+                    self._trace = None
+                self._trace_path = ""
+                if trace_file:
+                    self._trace = open(trace_file, "a", buffering=1)
+                self._trace_path = trace_file
+            self.enabled = bool(enabled)
+
+    def span(self, name: str):
+        """Context manager timing a span."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(name)
+
+    @contextlib.contextmanager
+    def _span(self, name: str):
+        start = time.time()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started, start)
+
+    def record(self, name: str, duration: float, start: float) -> None:
+        """Record a span which lasted duration seconds since start."""
+        with self._lock:
+            span = self._spans.get(name)
+            if not span:
+                span = self._spans[name] = SpanStats()
+            span.add(duration)
+            if self._trace:
+                self._trace.write(
+                    json.dumps(
+                        {
+                            "span": name,
+                            "start": start,
+                            "ms": duration * 1000,
+                            "thread": threading.current_thread().name,
+                        }
+                    )
+                    + "\n"
+                )
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """Summary of every span."""
+        with self._lock:
+            return {name: span.summary() for name, span in self._spans.items()}
+
+    def reset(self) -> None:
+        """Forget recorded spans."""
+        with self._lock:
+            self._spans = {}
+
+
+_NULL_SPAN = contextlib.suppress()
+
+STATS = Stats()
+
+
+def timed(name: str) -> Callable:
+    """Decorator timing calls of a function as a span."""
+
+    def _decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def _timed(*args, **kwargs) -> Any:
+            if not STATS.enabled:
+                return func(*args, **kwargs)
+            with STATS._span(name):
+                return func(*args, **kwargs)
+
+        return _timed
+
+    return _decorator
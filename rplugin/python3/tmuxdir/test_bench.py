@@ -0,0 +1,228 @@
+"""Benchmarks of the hot paths, they only run if TMUXDIR_BENCH is set.
+
+Results are written to JSON and compared against a saved baseline with
+pytest-benchmark, for instance:
+
+    TMUXDIR_BENCH=1 pytest tmuxdir/test_bench.py --benchmark-autosave
+    TMUXDIR_BENCH=1 pytest tmuxdir/test_bench.py --benchmark-compare \
+        --benchmark-compare-fail=mean:15%
+
+tmux is driven by a fake tmux binary on $PATH, so results don't depend on
+a running tmux server.
+"""
+import os
+import random
+import stat
+import sys
+from typing import List
+from tmuxdir.config_handler import ConfigHandler
+from tmuxdir.dirmngr import DirMngr
+from tmuxdir.tmux_session_facade import TmuxSessionFacade, parse_sessions
+import pytest
+
+bench = pytest.mark.skipif(
+    not os.environ.get("TMUXDIR_BENCH", False), reason="TMUXDIR_BENCH isn't set"
+)
+
+_FAKE_TMUX = """#!{python} -S
+import os
+import re
+import sys
+
+args = sys.argv[1:]
+if args == ["-V"]:
+    print("tmux 3.2a")
+elif args and args[0] in ("list-sessions", "ls"):
+    fmt = args[args.index("-F") + 1]
+    with open(os.environ["FAKE_TMUX_SESSIONS"]) as f:
+        for line in f:
+            items = line.rstrip("\\n").split("\\t")
+            fields = dict(item.split("=", 1) for item in items)
+            out = re.sub(r"#{{@?(\\w+)}}", lambda m: fields.get(m.group(1), "0"), fmt)
+            windows = int(fields.get("session_windows", "1"))
+            print(re.sub(r"#{{W:([^}}]*)}}", lambda m: m.group(1) * windows, out))
+elif args and args[0] == "display-message":
+    print(args[-1])
+"""
+
+
+def make_tree(
+    root: str,
+    breadth=4,
+    depth=3,
+    marker_density=0.2,
+    symlinks=0,
+    marker=".git",
+    seed=0,
+) -> List[str]:
+    """Generate a synthetic tree of breadth sub dirs per dir down to depth,
+    a marker_density ratio of them being projects, plus symlinks to random
+    dirs. Return the project dirs."""
+
+    rand = random.Random(seed)
+    dirs = [root]
+    projects = []
+    parents = [root]
+    for _ in range(depth):
+        children = []
+        for parent in parents:
+            for i in range(breadth):
+                child = os.path.join(parent, "d{}".format(i))
+                os.makedirs(child)
+                if rand.random() < marker_density:
+                    os.makedirs(os.path.join(child, marker))
+                    projects.append(child)
+                children.append(child)
+        dirs.extend(children)
+        parents = children
+    for i in range(symlinks):
+        link = os.path.join(rand.choice(dirs), "l{}".format(i))
+        os.symlink(rand.choice(dirs), link)
+    return projects
+
+
+@pytest.fixture
+def fake_tmux(tmp_path, monkeypatch):
+    """Put a fake tmux on $PATH, return a function setting its sessions."""
+
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    tmux = bin_dir / "tmux"
+    tmux.write_text(_FAKE_TMUX.format(python=sys.executable))
+    tmux.chmod(tmux.stat().st_mode | stat.S_IEXEC)
+    sessions_file = tmp_path / "sessions"
+    sessions_file.write_text("")
+    monkeypatch.setenv("PATH", os.pathsep.join([str(bin_dir), os.environ["PATH"]]))
+    monkeypatch.setenv("FAKE_TMUX_SESSIONS", str(sessions_file))
+    monkeypatch.delenv("TMUX", raising=False)
+
+    def _set_sessions(count: int) -> None:
+        lines = []
+        for i in range(count):
+            fields = {
+                "session_name": "~/repos/project-{}".format(i),
+                "session_created": str(1600000000 + i),
+                "session_attached": str(int(i == 0)),
+                "session_windows": str(1 + i % 3),
+                "window_panes": "2",
+                "session_group": "",
+                "tmuxdir_prewarm": "",
+                "session_activity": str(1600000000 + count - i),
+                "session_path": "/home/user/repos/project-{}".format(i),
+            }
+            lines.append("\t".join("=".join(item) for item in fields.items()))
+        sessions_file.write_text("\n".join(lines) + "\n" if lines else "")
+
+    return _set_sessions
+
+
+@pytest.fixture
+def cfg_handler(tmp_path) -> ConfigHandler:
+    return ConfigHandler(folder_name=str(tmp_path / "config"))
+
+
+class TestBenchHarness:
+    def test_make_tree(self, tmp_path):
+        first, second = str(tmp_path / "first"), str(tmp_path / "second")
+        projects = make_tree(first, breadth=3, depth=2, symlinks=2)
+        again = make_tree(second, breadth=3, depth=2, symlinks=2)
+        assert [os.path.relpath(p, first) for p in projects] == [
+            os.path.relpath(p, second) for p in again
+        ]
+        assert all(os.path.isdir(os.path.join(p, ".git")) for p in projects)
+
+    def test_fake_tmux(self, fake_tmux):
+        fake_tmux(3)
+        sessions = TmuxSessionFacade().refresh()
+        assert list(sessions) == ["~/repos/project-{}".format(i) for i in range(3)]
+        assert sessions["~/repos/project-0"].attached == 1
+        assert sessions["~/repos/project-2"].windows == 3
+        assert sessions["~/repos/project-2"].panes == 6
+        assert sessions["~/repos/project-2"].path == "/home/user/repos/project-2"
+
+
+@bench
+class TestBench:
+    @pytest.mark.parametrize(
+        "breadth,depth,density,symlinks",
+        [(8, 3, 0.05, 0), (8, 3, 0.5, 0), (4, 5, 0.1, 16)],
+        ids=["sparse", "dense", "deep-symlinks"],
+    )
+    @pytest.mark.parametrize("eager", [False, True], ids=["not-eager", "eager"])
+    def test_find_projects(
+        self,
+        benchmark,
+        tmp_path,
+        cfg_handler,
+        breadth,
+        depth,
+        density,
+        symlinks,
+        eager,
+    ):
+        root = str(tmp_path / "tree")
+        make_tree(root, breadth, depth, density, symlinks)
+        dir_mngr = DirMngr([root], [".git"], eager, cfg_handler=cfg_handler)
+        benchmark(dir_mngr.find_projects, root, [".git"], depth, eager)
+
+    @pytest.mark.parametrize("warm", [False, True], ids=["cold", "warm"])
+    def test_list_dirs(self, benchmark, tmp_path, cfg_handler, warm):
+        root = str(tmp_path / "tree")
+        make_tree(root, breadth=8, depth=3, marker_density=0.1)
+        dir_mngr = DirMngr([root], [".git"], True, cfg_handler=cfg_handler)
+
+        def _setup():
+            if not warm:
+                dir_mngr.index.clear()
+
+        benchmark.pedantic(dir_mngr.list_dirs, setup=_setup, rounds=20)
+
+    @pytest.mark.parametrize("entries", [10000, 100000])
+    def test_config_save(self, benchmark, cfg_handler, entries):
+        dirs = {"/tmp/d{}".format(i): "/tmp/d{}".format(i) for i in range(entries)}
+        os.makedirs(cfg_handler._folder, exist_ok=True)
+        benchmark(cfg_handler.save, {"dirs": dirs, "ignored_dirs": {}})
+
+    @pytest.mark.parametrize("entries", [10000, 100000])
+    def test_config_load(self, benchmark, cfg_handler, entries):
+        dirs = {"/tmp/d{}".format(i): "/tmp/d{}".format(i) for i in range(entries)}
+        os.makedirs(cfg_handler._folder, exist_ok=True)
+        cfg_handler.save({"dirs": dirs, "ignored_dirs": {}})
+        assert len(benchmark(cfg_handler.load)["dirs"]) == entries
+
+    @pytest.mark.parametrize("count", [100, 500])
+    def test_sessions(self, benchmark, fake_tmux, count):
+        fake_tmux(count)
+        tmuxf = TmuxSessionFacade()
+        assert len(benchmark(tmuxf.refresh)) == count
+
+    def test_parse_sessions(self, benchmark):
+        line = "~/repos/p-{0}:1600000000:0:3:2 1 4 :1600000100::42:::/home/u/p {0}\n"
+        out = "".join(line.format(i) for i in range(500))
+        assert len(benchmark(parse_sessions, out)) == 500
+
+    def test_gather_candidates(self, benchmark, tmp_path, monkeypatch, fake_tmux):
+        pytest.importorskip("denite.source.base")
+        fake_tmux(20)
+        from denite.source.tmux_dir import Source
+        from tmuxdir.tmuxdir_facade import TmuxDirFacade
+
+        root = str(tmp_path / "tree")
+        make_tree(root, breadth=8, depth=3, marker_density=0.1)
+        monkeypatch.setenv("TMUXDIR_CONFIG_FOLDER", str(tmp_path / "config"))
+        monkeypatch.setattr(TmuxDirFacade, "_instance", None)
+        settings = {"base_dirs": [root], "root_markers": [".git"], "eager_mode": True}
+
+        class _Vim:
+            def eval(self, expr):
+                return settings
+
+        def _gather():
+            source = Source(_Vim())
+            context = {"is_async": False}
+            candidates = source.gather_candidates(context)
+            while context["is_async"]:
+                candidates += source.gather_candidates(context)
+            return candidates
+
+        assert benchmark(_gather)
@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+from tmuxdir.daemon import DaemonClient, DaemonException, DaemonServer, socket_path
+from tmuxdir.tmuxdir_facade import (
+    DaemonDirMngr,
+    TmuxDirFacade,
+    TmuxDirFacadeException,
+)
+import pytest
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setenv("TMUXDIR_CONFIG_FOLDER", str(tmp_path / "cfg"))
+    os.makedirs(str(tmp_path / "cfg"))
+    server = DaemonServer(socket_path(), idle_timeout=0)
+    thread = threading.Thread(target=server.serve, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join(5)
+
+
+class TestDaemon:
+    def test_shared_dirs(self, server, tmp_path, monkeypatch):
+        monkeypatch.setattr(TmuxDirFacade, "_check_tmux_bin", lambda self: True)
+        monkeypatch.setattr(TmuxDirFacade, "_instance", None)
+        monkeypatch.setattr(TmuxDirFacade, "_instance_key", None)
+        for path in ("base/a/.git", "base/b/.git", "added"):
+            os.makedirs(str(tmp_path / path))
+        base = str(tmp_path / "base")
+        settings = {"base_dirs": [base], "daemon": True}
+        editor = TmuxDirFacade.instance(settings)
+        assert isinstance(editor.dir_mngr, DaemonDirMngr)
+        other = TmuxDirFacade([base], daemon=True)
+
+        expected = [os.path.join(base, "a"), os.path.join(base, "b")]
+        assert sorted(editor.list_dirs()) == expected
+        assert sorted(other.cached_dirs()) == expected
+        status = other.scan_status()
+        assert not status["running"] and status["projects"] == 2
+
+        added = str(tmp_path / "added")
+        assert editor._add(added) == added
+        assert editor.ignore(os.path.join(base, "b"))
+        assert other.dirs == {added: added}
+        assert list(other.ignored_dirs) == [os.path.join(base, "b")]
+        assert sorted(other.iter_dirs()) == [added, os.path.join(base, "a")]
+        assert other.clear_ignored_dirs() and other.clear_added_dirs()
+        assert editor.dirs == {} and editor.ignored_dirs == {}
+        assert TmuxDirFacade.instance(settings) is editor
+
+        with pytest.raises(TmuxDirFacadeException):
+            TmuxDirFacade([base], [""], daemon=True).list_dirs()
+        with pytest.raises(DaemonException):
+            editor.dir_mngr.client.call("nope")
+
+    def test_coalesced_listing(self, server, tmp_path, monkeypatch):
+        os.makedirs(str(tmp_path / "base" / "a" / ".git"))
+        client = DaemonClient(socket_path(), autostart=False)
+        settings = {"base_dirs": [str(tmp_path / "base")], "root_markers": [".git"]}
+        client.call("list_dirs", settings)
+        entry = next(iter(server._entries.values()))
+        listed = []
+        list_dirs = entry.dir_mngr.list_dirs
+
+        def _list_dirs():
+            listed.append(None)
+            time.sleep(0.2)
+            return list_dirs()
+
+        monkeypatch.setattr(entry.dir_mngr, "list_dirs", _list_dirs)
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(client.call("list_dirs", settings))
+            )
+            for _ in range(2)
+        ]
+        threads[0].start()
+        time.sleep(0.05)
+        threads[1].start()
+        for thread in threads:
+            thread.join(5)
+        assert len(listed) == 1 and results[0] == results[1]
+
+    def test_autostart(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("TMUXDIR_CONFIG_FOLDER", str(tmp_path))
+        path = socket_path()
+        with pytest.raises(DaemonException):
+            DaemonClient(path, autostart=False).call("ping")
+        client = DaemonClient(path)
+        pid = client.call("ping")
+        assert pid != os.getpid()
+        assert DaemonClient(path, autostart=False).call("ping") == pid
+        assert client.call("shutdown")
+        deadline = time.monotonic() + 5
+        while os.path.exists(path) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert not os.path.exists(path)
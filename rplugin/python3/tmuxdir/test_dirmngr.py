@@ -1,5 +1,17 @@
+import errno
 import os
-from tmuxdir.dirmngr import ConfigHandler, DirMngr
+import threading
+import time
+from tmuxdir import dirmngr
+from tmuxdir.dirmngr import ConfigHandler, DirMngr, ProjectStore
+from tmuxdir.scanner import ProjectWalker
+from tmuxdir.watcher import (
+    Inotify,
+    InotifyProjectWatcher,
+    ProjectWatcher,
+    WatcherException,
+    start_watcher,
+)
 import pytest
 
 
@@ -9,10 +21,8 @@ def dir_mngr() -> DirMngr:
     os.makedirs(folder_name, exist_ok=True)
     cfg_handler = ConfigHandler(folder_name=folder_name)
     yield DirMngr([], [".git"], cfg_handler=cfg_handler)
-    try:
-        os.remove(str(cfg_handler._full_path))
-    except FileNotFoundError:
-        pass
+    for file_name in os.listdir(folder_name):
+        os.remove(os.path.join(folder_name, file_name))
     os.removedirs(folder_name)
 
 
@@ -22,10 +32,8 @@ def cfg_handler() -> ConfigHandler:
     os.makedirs(folder_name, exist_ok=True)
     config_handler = ConfigHandler(folder_name=folder_name)
     yield config_handler
-    try:
-        os.remove(str(config_handler._full_path))
-    except FileNotFoundError:
-        pass
+    for file_name in os.listdir(folder_name):
+        os.remove(os.path.join(folder_name, file_name))
     os.removedirs(folder_name)
 
 
@@ -94,3 +102,428 @@ class TestDirManager:
     )
     def test_find_projects_v11_not_eager(self, benchmark, dir_mngr: DirMngr) -> None:
         benchmark(dir_mngr.find_projects, "~/b/repos", [".git"], 3, False)
+
+    def test_journal(self, cfg_handler: ConfigHandler):
+        cfg_handler.save({"dirs": {"/a": "/a"}, "ignored_dirs": {}})
+        cfg_handler.append([("set", "dirs", "/b"), ("pop", "dirs", "/a")])
+        cfg_handler.append([("set", "ignored_dirs", "/c"), ("clear", "dirs")])
+        expected = {"dirs": {}, "ignored_dirs": {"/c": "/c"}}
+        assert cfg_handler.load() == expected
+
+        with open(cfg_handler._journal_path, "ab") as handle:
+            handle.write(b"\x80\x05\x95")
+        assert cfg_handler.load() == expected
+
+        cfg_handler.compact()
+        assert not os.path.exists(cfg_handler._journal_path)
+        assert cfg_handler.load() == expected
+
+    def test_journal_torn_tail(self, cfg_handler: ConfigHandler):
+        cfg_handler.save({"dirs": {}, "ignored_dirs": {}})
+        cfg_handler.append([("set", "dirs", "/a")])
+        with open(cfg_handler._journal_path, "ab") as handle:
+            handle.write(b"\x80\x05\x95")
+        assert cfg_handler.load() == {"dirs": {"/a": "/a"}, "ignored_dirs": {}}
+
+        cfg_handler.append([("set", "dirs", "/b")])
+        expected = {"dirs": {"/a": "/a", "/b": "/b"}, "ignored_dirs": {}}
+        assert cfg_handler.load() == expected
+        cfg_handler.compact()
+        assert cfg_handler.load() == expected
+
+    def test_journal_compaction(self, cfg_handler: ConfigHandler):
+        cfg_handler._compact_after = 3
+        for i in range(4):
+            cfg_handler.append([("set", "dirs", str(i))])
+        assert not os.path.exists(cfg_handler._journal_path)
+        assert len(cfg_handler.load()["dirs"]) == 4
+
+    def test_concurrent_saves(self, cfg_handler: ConfigHandler):
+        errors = []
+
+        def _save(dir_path):
+            for _ in range(30):
+                try:
+                    cfg_handler.save({"dirs": {dir_path: dir_path}})
+                except OSError as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=_save, args=(d,)) for d in "ab"]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        assert errors == []
+        assert cfg_handler.load() in ({"dirs": {d: d}} for d in "ab")
+        assert os.listdir(cfg_handler._folder) == ["dirs.pickle"]
+
+    def test_add_single_append(self, dir_mngr: DirMngr, tmp_path, monkeypatch):
+        for i in range(5):
+            os.makedirs(str(tmp_path / str(i) / ".git"))
+        appends = []
+        monkeypatch.setattr(dir_mngr.cfg_handler, "append", appends.append)
+        assert len(dir_mngr.add(str(tmp_path))) == 5
+        assert len(appends) == 1 and len(appends[0]) == 5
+
+    def test_add_cancelled(self, dir_mngr: DirMngr, tmp_path, monkeypatch):
+        for i in range(5):
+            os.makedirs(str(tmp_path / str(i) / ".git"))
+        cancelled = threading.Event()
+        listed = []
+        list_dir = ProjectWalker._list
+
+        def _list(walker, dir_path):
+            listed.append(dir_path)
+            cancelled.set()
+            return list_dir(walker, dir_path)
+
+        monkeypatch.setattr(ProjectWalker, "_list", _list)
+        appends = []
+        monkeypatch.setattr(dir_mngr.cfg_handler, "append", appends.append)
+        assert dir_mngr.add(str(tmp_path), cancelled) == []
+        assert listed == [str(tmp_path)]
+        assert appends == [] and dir_mngr.dirs == {}
+
+    def test_add_doesnt_block_saves(
+        self, dir_mngr: DirMngr, tmp_git_folder, monkeypatch
+    ):
+        started, release = threading.Event(), threading.Event()
+        find_projects = dir_mngr.find_projects
+
+        def _find_projects(*args, **kwargs):
+            started.set()
+            release.wait(5)
+            return find_projects(*args, **kwargs)
+
+        monkeypatch.setattr(dir_mngr, "find_projects", _find_projects)
+        adding = threading.Thread(target=dir_mngr.add, args=(tmp_git_folder,))
+        adding.start()
+        assert started.wait(5)
+        ignoring = threading.Thread(target=dir_mngr.ignore, args=("/tmp/foo",))
+        ignoring.start()
+        ignoring.join(2)
+        assert not ignoring.is_alive()
+        release.set()
+        adding.join(5)
+        assert list(dir_mngr.dirs) == [tmp_git_folder]
+        assert dir_mngr.cfg_handler.load()["ignored_dirs"] == {"/tmp/foo": "/tmp/foo"}
+
+    def test_validate_dirs(self, dir_mngr: DirMngr, tmp_git_folder, monkeypatch):
+        dir_mngr._add(tmp_git_folder)
+        dir_mngr.ignore("/tmp/tmuxdir-gone")
+        dir_mngr.ignore("~")
+        appends = []
+        monkeypatch.setattr(dir_mngr.cfg_handler, "append", appends.append)
+        assert dir_mngr.validate_dirs() == ["/tmp/tmuxdir-gone"]
+        assert dir_mngr.ignored_dirs == {"~": "~"}
+        assert appends == [[("pop", "ignored_dirs", "/tmp/tmuxdir-gone")]]
+        assert dir_mngr.validate_dirs() == []
+        assert len(appends) == 1
+
+    def test_validate_dirs_timeout(self, dir_mngr: DirMngr, monkeypatch):
+        dir_mngr._add("/tmp/tmuxdir-slow")
+        monkeypatch.setattr(dirmngr, "_stuck_mounts", set())
+        monkeypatch.setattr(os.path, "isdir", lambda path: time.sleep(0.5))
+        assert dir_mngr.validate_dirs(timeout=0.01) == []
+        assert "/tmp/tmuxdir-slow" in dir_mngr.dirs
+        # a stuck stat can't hold up interpreter exit
+        main = threading.main_thread()
+        assert all(t.daemon for t in threading.enumerate() if t is not main)
+
+    def test_validate_dirs_stuck_mount(self, dir_mngr: DirMngr, monkeypatch):
+        for path in ("/hung/a", "/hung/b", "/tmp/tmuxdir-gone"):
+            dir_mngr._add(path)
+        monkeypatch.setattr(dirmngr, "_stuck_mounts", set())
+        monkeypatch.setattr(dirmngr, "_mount_points", lambda: ["/hung", "/"])
+        hung = threading.Event()
+        stats = []
+
+        def _isdir(path):
+            stats.append(path)
+            if path.startswith("/hung"):
+                hung.wait(5)
+            return False
+
+        monkeypatch.setattr(os.path, "isdir", _isdir)
+        # each path gets its own timeout, other mounts are still checked
+        assert dir_mngr.validate_dirs(timeout=0.05) == ["/tmp/tmuxdir-gone"]
+        assert len([path for path in stats if path.startswith("/hung")]) == 1
+        # no more stats are queued on a mount with a stuck stat
+        assert dir_mngr.validate_dirs(timeout=0.05) == []
+        assert len([path for path in stats if path.startswith("/hung")]) == 1
+        assert {"/hung/a", "/hung/b"} <= set(dir_mngr.dirs)
+
+        hung.set()
+        deadline = time.monotonic() + 5
+        while dirmngr._stuck_mounts and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert sorted(dir_mngr.validate_dirs(timeout=1)) == ["/hung/a", "/hung/b"]
+
+
+def _glob_find_projects(root_dir, root_markers, depth=3, eager=False):
+    """Per marker, per depth pathlib.glob reference of find_projects."""
+    import pathlib
+
+    dirs = []
+    for cur_depth in range(1, depth + 1):
+        for marker in root_markers:
+            expr = "{}*{}".format((cur_depth - 1) * "*/", marker)
+            for d in pathlib.Path(root_dir).glob(expr):
+                dirs.append(str(d.parent))
+        if dirs and not eager:
+            break
+    return dirs
+
+
+class TestProjectWalker:
+    @pytest.fixture
+    def tree(self, tmp_path) -> str:
+        for path in (
+            "a/.git",
+            "a/nested/.git",
+            "b/c/.hg",
+            "b/d/e/.git",
+            "b/d/e/f/.git",
+            "g/h",
+            "i/j/bare.git",
+        ):
+            os.makedirs(str(tmp_path / path))
+        (tmp_path / "b" / "c" / "Makefile").write_text("")
+        return str(tmp_path)
+
+    @pytest.mark.parametrize("eager", [False, True])
+    @pytest.mark.parametrize("depth", [1, 2, 3, 4])
+    @pytest.mark.parametrize("markers", [[".git"], [".git", ".hg", "Makefile"]])
+    def test_matches_glob(self, dir_mngr, tree, eager, depth, markers):
+        found = dir_mngr.find_projects(tree, markers, depth, eager)
+        assert len(found) == len(set(found))
+        assert set(found) == set(_glob_find_projects(tree, markers, depth, eager))
+
+    def test_home_relative(self, dir_mngr, tree, monkeypatch):
+        monkeypatch.setenv("HOME", tree)
+        dir_mngr.project_dirs = ProjectStore()
+        assert set(dir_mngr.find_projects("~", [".git"], 2, False)) == {"~/a"}
+
+    def test_stop_at_projects(self, tree, monkeypatch):
+        listed = []
+        list_dir = ProjectWalker._list
+
+        def _list(walker, dir_path):
+            listed.append(os.path.relpath(dir_path, tree))
+            return list_dir(walker, dir_path)
+
+        monkeypatch.setattr(ProjectWalker, "_list", _list)
+        walker = ProjectWalker([".git"], depth=4, eager=True, stop_at_projects=True)
+        found = {os.path.relpath(d, tree) for d in walker.walk(tree)}
+        assert found == {"a", "b/d/e", "i/j"}
+        assert "a/nested" not in listed and "b/d/e/f" not in listed
+
+    def test_project_store(self, dir_mngr, tree, monkeypatch):
+        monkeypatch.setenv("HOME", os.path.join(tree, "b"))
+        store = ProjectStore()
+        dir_mngr.project_dirs = store
+        listed = dir_mngr.find_projects(tree, [".git", ".hg"], 4, True)
+        again = {d: d for d in dir_mngr.find_projects(tree, [".git", ".hg"], 4, True)}
+        assert all(again[d] is d for d in listed) and "~/c" in again
+
+        record = store.get("~/c")
+        assert record.path == os.path.join(tree, "b", "c")
+        assert record is store.add(os.path.join(tree, "b", "c"))
+        assert store.add(os.path.join(tree, "bc.d")).dir == tree + "/bc.d"
+        assert store.get(tree + "/bc.d").session_name == tree + "/bc-d"
+
+    def test_prune(self, dir_mngr, tree, monkeypatch):
+        walker = ProjectWalker(
+            [".git"], depth=4, eager=True, exclude_patterns=["nested", tree + "/b/d"]
+        )
+        assert {os.path.relpath(d, tree) for d in walker.walk(tree)} == {"a", "i/j"}
+
+        monkeypatch.setenv("HOME", tree)
+        dir_mngr.project_dirs = ProjectStore()
+        dir_mngr.ignore("~/b")
+        dir_mngr.ignore(os.path.join(tree, "i"))
+        found = dir_mngr.find_projects(tree, [".git"], 4, True)
+        assert set(found) == {"~/a", "~/a/nested"}
+
+
+class TestProjectIndex:
+    @pytest.fixture
+    def tree(self, tmp_path) -> str:
+        for path in ("a/.git", "b/c/.git", "d/e/f"):
+            os.makedirs(str(tmp_path / path))
+        for root, dirs, _ in os.walk(str(tmp_path)):
+            os.utime(root, (0, 0))
+        return str(tmp_path)
+
+    def _dir_mngr(self, dir_mngr: DirMngr, tree: str) -> DirMngr:
+        return DirMngr([tree], [".git"], True, cfg_handler=dir_mngr.cfg_handler)
+
+    def test_warm_list_dirs(self, dir_mngr, tree, monkeypatch):
+        cold = self._dir_mngr(dir_mngr, tree)
+        expected = sorted(cold.list_dirs())
+        assert expected == [os.path.join(tree, "a"), os.path.join(tree, "b/c")]
+
+        listed = []
+        list_dir = ProjectWalker._list
+
+        def _list(walker, dir_path):
+            listed.append(dir_path)
+            return list_dir(walker, dir_path)
+
+        monkeypatch.setattr(ProjectWalker, "_list", _list)
+        warm = self._dir_mngr(dir_mngr, tree)
+        assert warm.index.projects == cold.index.projects
+        assert sorted(warm.list_dirs()) == expected
+        assert listed == []
+
+        os.makedirs(os.path.join(tree, "d", "e", ".git"))
+        os.utime(os.path.join(tree, "d", "e"), (0, 1))
+        assert sorted(warm.list_dirs()) == sorted(expected + [tree + "/d/e"])
+        assert listed == [os.path.join(tree, "d", "e")]
+
+    def test_root_markers_change(self, dir_mngr, tree):
+        self._dir_mngr(dir_mngr, tree).list_dirs()
+        other = DirMngr([tree], [".hg"], cfg_handler=dir_mngr.cfg_handler)
+        assert other.index.dirs == {}
+        assert other.list_dirs() == []
+
+    @pytest.mark.parametrize("eager", [False, True])
+    def test_scan_workers(self, dir_mngr, tree, tmp_path, eager):
+        other = str(tmp_path / "d")
+        sequential = DirMngr([tree, other], [".git"], eager, dir_mngr.cfg_handler)
+        expected = sorted(sequential.list_dirs())
+        walker = ProjectWalker([".git"], eager=eager, workers=4)
+        assert sorted(walker.walk_many([tree, other])) == expected
+
+    def test_iter_dirs_cached_dirs(self, dir_mngr, tree):
+        cold = self._dir_mngr(dir_mngr, tree)
+        assert cold.cached_dirs() == []
+        cold._add("/tmp")
+        it = cold.iter_dirs()
+        assert next(it) == "/tmp"
+        assert sorted(it) == [os.path.join(tree, "a"), os.path.join(tree, "b/c")]
+        assert cold.project_dirs.get(os.path.join(tree, "a")).marker == ".git"
+        warm = self._dir_mngr(dir_mngr, tree)
+        assert sorted(warm.cached_dirs()) == sorted(cold.list_dirs())
+
+    def test_scan_budget(self, dir_mngr, tree, monkeypatch):
+        expected = sorted(self._dir_mngr(dir_mngr, tree).list_dirs())
+        os.makedirs(os.path.join(tree, "d", "g", ".git"))
+        gate = threading.Event()
+        list_dir = ProjectWalker._list
+
+        def _list(walker, dir_path):
+            gate.wait(5)
+            return list_dir(walker, dir_path)
+
+        monkeypatch.setattr(ProjectWalker, "_list", _list)
+        budgeted = DirMngr(
+            [tree], [".git"], True, cfg_handler=dir_mngr.cfg_handler, scan_budget_ms=50
+        )
+        assert budgeted.scan_status() == {}
+        start = time.monotonic()
+        assert sorted(budgeted.list_dirs()) == expected
+        assert time.monotonic() - start < 2
+        status = budgeted.scan_status()
+        assert status["running"] and status["coverage"] < 1 and status["pending"]
+
+        gate.set()
+        scan = budgeted.scan()
+        while not scan.done:
+            scan.wait(len(scan.projects), 5)
+        status = budgeted.scan_status()
+        assert not status["running"] and status["coverage"] == 1
+        assert status["projects"] == 3
+        expected.append(os.path.join(tree, "d/g"))
+        assert sorted(budgeted.index.projects) == expected
+        assert sorted(budgeted.list_dirs()) == expected
+
+    def test_shared_scan(self, dir_mngr, tree, monkeypatch):
+        shared = self._dir_mngr(dir_mngr, tree)
+        expected = sorted(shared.list_dirs())
+        gate = threading.Event()
+        walks = []
+        walk_base_dirs = shared._walk_base_dirs
+
+        def _walk_base_dirs(walker):
+            walks.append(walker)
+            gate.wait(5)
+            yield from walk_base_dirs(walker)
+
+        monkeypatch.setattr(shared, "_walk_base_dirs", _walk_base_dirs)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(sorted(shared.list_dirs())))
+            for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        gate.set()
+        for thread in threads:
+            thread.join(5)
+        assert results == [expected, expected]
+        assert len(walks) == 1
+
+
+class TestProjectWatcher:
+    def _wait_for(self, watcher, expected) -> list:
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            if sorted(watcher.dirs() or []) == expected:
+                break
+            time.sleep(0.02)
+        return sorted(watcher.dirs() or [])
+
+    @pytest.mark.parametrize("watcher_cls", [ProjectWatcher, InotifyProjectWatcher])
+    def test_watch(self, tmp_path, watcher_cls):
+        os.makedirs(str(tmp_path / "a" / ".git"))
+        os.makedirs(str(tmp_path / "b" / "c"))
+        try:
+            watcher = watcher_cls([str(tmp_path)], [".git"], eager=True, interval=0.02)
+        except WatcherException:
+            pytest.skip("inotify isn't available")
+        watcher.start()
+        assert watcher.wait_ready(5)
+        a, c = str(tmp_path / "a"), str(tmp_path / "b" / "c")
+        assert watcher.dirs() == [a]
+
+        os.makedirs(os.path.join(c, ".git"))
+        assert self._wait_for(watcher, [a, c]) == [a, c]
+        os.rmdir(os.path.join(a, ".git"))
+        assert self._wait_for(watcher, [c]) == [c]
+        watcher.stop()
+        assert watcher.dirs() is None
+
+    def test_not_eager(self, tmp_path):
+        for path in ("a/.git", "b/c/.git"):
+            os.makedirs(str(tmp_path / path))
+        watcher = start_watcher("auto", [str(tmp_path)], [".git"])
+        assert watcher.wait_ready(5)
+        assert watcher.dirs() == [str(tmp_path / "a")]
+        watcher.stop()
+        assert start_watcher("off", [str(tmp_path)], [".git"]) is None
+
+    def test_watch_limit(self, tmp_path, monkeypatch):
+        def add_watch(inotify, path, mask):
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC), path)
+
+        monkeypatch.setattr(Inotify, "add_watch", add_watch)
+        os.makedirs(str(tmp_path / "a" / ".git"))
+        watcher = start_watcher("auto", [str(tmp_path)], [".git"])
+        assert watcher.wait_ready(5) and watcher.polling
+        assert watcher.dirs() == [str(tmp_path / "a")]
+        watcher.stop()
+        watcher = start_watcher("inotify", [str(tmp_path)], [".git"])
+        assert not watcher.wait_ready(5) and watcher.dirs() is None
+
+    def test_home(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("HOME", str(tmp_path / "h"))
+        for path in ("h/a/.git", "hx/a/.git"):
+            os.makedirs(str(tmp_path / path))
+        roots = [str(tmp_path / "h"), str(tmp_path / "hx")]
+        watcher = ProjectWatcher(roots, [".git"], depth=2)
+        watcher.start()
+        assert watcher.wait_ready(5)
+        assert sorted(watcher.dirs()) == [str(tmp_path / "hx" / "a"), "~/a"]
+        watcher.stop()
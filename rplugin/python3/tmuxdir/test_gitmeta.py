@@ -0,0 +1,113 @@
+import os
+from tmuxdir.config_handler import ConfigHandler
+from tmuxdir.dirmngr import DirMngr
+from tmuxdir.gitmeta import GitMetaDiscovery
+import pytest
+
+
+@pytest.fixture
+def repos(tmp_path) -> str:
+    """A repo with a linked worktree outside of it, a worktree whose gitdir
+    is relative, a submodule with a nested one and a missing submodule."""
+    repo = tmp_path / "base" / "repo"
+    for path in (
+        "base/repo/.git/worktrees/feature",
+        "base/repo/.git/worktrees/relative",
+        "base/repo/.git/worktrees/gone",
+        "base/repo/libs/sub/deps/nested",
+        "elsewhere/feature",
+        "base/relative",
+    ):
+        os.makedirs(str(tmp_path / path))
+    worktrees = repo / ".git" / "worktrees"
+    (worktrees / "feature" / "gitdir").write_text(
+        str(tmp_path / "elsewhere" / "feature" / ".git") + "\n"
+    )
+    (worktrees / "relative" / "gitdir").write_text("../../../../relative/.git\n")
+    (worktrees / "gone" / "gitdir").write_text(str(tmp_path / "gone" / ".git"))
+    (repo / ".gitmodules").write_text(
+        '[submodule "sub"]\n\tpath = libs/sub\n\turl = ../sub\n'
+        '[submodule "missing"]\n\tpath = libs/missing\n'
+    )
+    (repo / "libs" / "sub" / ".gitmodules").write_text(
+        '[submodule "nested"]\n\tpath = deps/nested\n'
+    )
+    return str(tmp_path)
+
+
+class TestGitMetaDiscovery:
+    def test_discover(self, repos):
+        git_meta = GitMetaDiscovery()
+        found = git_meta.discover(os.path.join(repos, "base", "repo"))
+        assert sorted(os.path.relpath(d, repos) for d in found) == [
+            "base/relative",
+            "base/repo/libs/sub",
+            "base/repo/libs/sub/deps/nested",
+            "elsewhere/feature",
+        ]
+        assert git_meta.discover(os.path.join(repos, "elsewhere")) == []
+
+    def test_cache(self, repos, monkeypatch):
+        git_meta = GitMetaDiscovery()
+        repo = os.path.join(repos, "base", "repo")
+        found = git_meta.project(repo)
+        read_project = git_meta._read_project
+        reads = []
+
+        def _read_project(project, gitdirs):
+            reads.append(project)
+            return read_project(project, gitdirs)
+
+        monkeypatch.setattr(git_meta, "_read_project", _read_project)
+        assert git_meta.project(repo) is found
+        assert reads == []
+
+        os.makedirs(os.path.join(repo, "libs", "missing"))
+        modules = os.path.join(repo, ".gitmodules")
+        os.utime(modules, ns=(0, 0))
+        assert os.path.join(repo, "libs", "missing") in git_meta.project(repo)
+        assert reads == [repo]
+
+    def test_stat_first(self, repos, monkeypatch):
+        repo = os.path.join(repos, "base", "repo")
+        worktrees = os.path.join(repo, ".git", "worktrees")
+        for path in (worktrees, os.path.join(repo, ".gitmodules")):
+            os.utime(path, ns=(0, 0))
+        git_meta = GitMetaDiscovery()
+        found = git_meta.discover(repo, quick=True)
+        listed = []
+        scandir = os.scandir
+
+        def _scandir(path):
+            listed.append(path)
+            return scandir(path)
+
+        monkeypatch.setattr(os, "scandir", _scandir)
+        monkeypatch.setattr(git_meta, "_read_project", None)
+        assert git_meta.discover(repo, quick=True) is found
+        assert git_meta._key(repo)[1] and listed == []
+
+        os.utime(worktrees, ns=(10 ** 9, 10 ** 9))
+        monkeypatch.undo()
+        monkeypatch.setattr(os, "scandir", _scandir)
+        assert git_meta.discover(repo, quick=True) == found
+        assert listed == [worktrees]
+
+    def test_list_dirs(self, repos, monkeypatch):
+        monkeypatch.setenv("HOME", repos)
+        cfg_handler = ConfigHandler(folder_name=os.path.join(repos, "cfg"))
+        base = os.path.join(repos, "base")
+        dir_mngr = DirMngr([base], [".git"], cfg_handler=cfg_handler)
+        assert dir_mngr.list_dirs() == ["~/base/repo"]
+
+        dir_mngr = DirMngr(
+            [base], [".git"], cfg_handler=cfg_handler, git_discovery=True
+        )
+        assert sorted(dir_mngr.list_dirs()) == [
+            "~/base/relative",
+            "~/base/repo",
+            "~/base/repo/libs/sub",
+            "~/base/repo/libs/sub/deps/nested",
+            "~/elsewhere/feature",
+        ]
+        assert sorted(dir_mngr.cached_dirs()) == sorted(dir_mngr.list_dirs())
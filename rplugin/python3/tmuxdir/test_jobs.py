@@ -0,0 +1,95 @@
+import threading
+from tmuxdir.jobs import JobRunner
+
+
+class FakeNvim:
+    def __init__(self) -> None:
+        self.vars = {}
+        self.calls = []
+        self.commands = []
+        self.done = threading.Semaphore(0)
+
+    def async_call(self, fn, *args) -> None:
+        fn(*args)
+        self.done.release()
+
+    def call(self, name, *args):
+        self.calls.append((name,) + args)
+
+    def command(self, cmd) -> None:
+        self.commands.append(cmd)
+
+
+class TestJobRunner:
+    def test_submit(self):
+        nvim = FakeNvim()
+        jobs = JobRunner(nvim)
+        job_id = jobs.submit("TmuxdirListAdded", lambda cancelled: ["a"], "OnDone")
+        assert nvim.done.acquire(timeout=5)
+        report = {
+            "id": job_id,
+            "name": "TmuxdirListAdded",
+            "result": ["a"],
+            "error": "",
+            "cancelled": False,
+        }
+        assert nvim.vars["tmuxdir_job"] == report
+        assert nvim.calls == [("OnDone", report)]
+        assert "User TmuxdirJobDone" in nvim.commands[0]
+        assert jobs.pending() == {}
+
+    def test_error(self):
+        nvim = FakeNvim()
+        jobs = JobRunner(nvim)
+
+        def _fails(cancelled):
+            raise OSError("'/nope' isn't a directory.")
+
+        jobs.submit("TmuxdirAdd", _fails)
+        assert nvim.done.acquire(timeout=5)
+        assert nvim.vars["tmuxdir_job"]["error"] == "'/nope' isn't a directory."
+        assert nvim.calls == []
+
+    def test_cancel(self):
+        nvim = FakeNvim()
+        jobs = JobRunner(nvim)
+        started, release = threading.Event(), threading.Event()
+
+        def _blocks(cancelled):
+            started.set()
+            release.wait(5)
+            return True
+
+        running = jobs.submit("TmuxdirIgnore", _blocks)
+        pending = jobs.submit("TmuxdirAdd", lambda cancelled: ["a"])
+        assert started.wait(5)
+        assert jobs.pending() == {running: "TmuxdirIgnore", pending: "TmuxdirAdd"}
+
+        assert jobs.cancel(pending)
+        assert nvim.done.acquire(timeout=5)
+        assert nvim.vars["tmuxdir_job"]["id"] == pending
+        assert nvim.vars["tmuxdir_job"]["cancelled"]
+
+        assert jobs.cancel(running)
+        release.set()
+        assert nvim.done.acquire(timeout=5)
+        assert nvim.vars["tmuxdir_job"]["id"] == running
+        assert nvim.vars["tmuxdir_job"]["result"] is None
+        assert nvim.vars["tmuxdir_job"]["cancelled"]
+        assert not jobs.cancel(running)
+
+    def test_cancel_running(self):
+        nvim = FakeNvim()
+        jobs = JobRunner(nvim)
+        started = threading.Event()
+
+        def _walks(cancelled):
+            started.set()
+            return "stopped" if cancelled.wait(5) else "done"
+
+        job_id = jobs.submit("TmuxdirAddProjects", _walks)
+        assert started.wait(5)
+        assert jobs.cancel(job_id)
+        assert nvim.done.acquire(timeout=5)
+        assert nvim.vars["tmuxdir_job"]["cancelled"]
+        assert nvim.vars["tmuxdir_job"]["result"] is None
@@ -0,0 +1,64 @@
+import os
+from tmuxdir.markers import MarkerException, MarkerMatcher
+from tmuxdir.scanner import ProjectWalker
+from tmuxdir.watcher import ProjectWatcher
+import pytest
+
+
+def _flags(matcher: MarkerMatcher, *names: str) -> int:
+    flags = 0
+    for name in names:
+        flags |= matcher.flags(name)
+    return flags
+
+
+class TestMarkerMatcher:
+    def test_suffix_exact_and_glob(self):
+        matcher = MarkerMatcher([".git", "*.sln", "*.cabal"])
+        assert matcher.is_project(_flags(matcher, "src", ".git"))
+        assert matcher.is_project(_flags(matcher, "bare.git"))
+        assert matcher.is_project(_flags(matcher, "app.sln"))
+        assert matcher.is_project(_flags(matcher, "pkg.cabal"))
+        assert not matcher.is_project(_flags(matcher, "git", "sln", "a.slnx"))
+
+        exact = MarkerMatcher([{"name": ".git"}, {"name": "a", "without": ["b.git"]}])
+        assert exact.is_project(_flags(exact, ".git"))
+        assert not exact.is_project(_flags(exact, "bare.git"))
+        assert exact.is_project(_flags(exact, "a", ".git"))
+        assert not exact.is_project(_flags(exact, "a", "b.git"))
+
+    def test_rules(self):
+        matcher = MarkerMatcher(
+            [
+                {"name": "pyproject.toml", "without": ["setup.py"]},
+                {"name": "Makefile", "with": ["*.c"], "not_inside": [".git"]},
+            ]
+        )
+        assert matcher.needs_ancestors
+        assert matcher.is_project(_flags(matcher, "pyproject.toml"))
+        assert not matcher.is_project(_flags(matcher, "pyproject.toml", "setup.py"))
+        assert matcher.is_project(_flags(matcher, "Makefile", "main.c"))
+        assert not matcher.is_project(_flags(matcher, "Makefile"))
+        inherited = _flags(matcher, ".git")
+        assert not matcher.is_project(_flags(matcher, "Makefile", "a.c"), inherited)
+
+    @pytest.mark.parametrize("marker", [{"with": [".git"]}, "", 1])
+    def test_invalid(self, marker):
+        with pytest.raises(MarkerException):
+            MarkerMatcher([marker])
+
+    def test_not_inside(self, tmp_path):
+        for path in ("a/.git", "a/sub/pyproject.toml", "b/pyproject.toml"):
+            path = tmp_path / path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.touch()
+        markers = [".git", {"name": "pyproject.toml", "not_inside": [".git"]}]
+        walker = ProjectWalker(markers, eager=True)
+        found = {os.path.relpath(d, str(tmp_path)) for d in walker.walk(str(tmp_path))}
+        assert found == {"a", "b"}
+
+        watcher = ProjectWatcher([str(tmp_path)], markers, eager=True)
+        watcher.start()
+        watcher.stop()
+        assert watcher._inherited(0, str(tmp_path / "a" / "sub"))
+        assert not watcher._inherited(0, str(tmp_path / "b"))
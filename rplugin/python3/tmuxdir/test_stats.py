@@ -0,0 +1,66 @@
+import json
+from tmuxdir.dirmngr import DirMngr
+from tmuxdir.stats import STATS, SpanStats, Stats, timed
+from tmuxdir.tmuxdir_facade import TmuxDirFacade, TmuxDirFacadeException
+import pytest
+
+
+@pytest.fixture
+def stats():
+    STATS.configure(True)
+    STATS.reset()
+    yield STATS
+    STATS.configure(False)
+    STATS.reset()
+
+
+class TestStats:
+    def test_summary(self):
+        span = SpanStats()
+        for ms in range(1, 101):
+            span.add(ms / 1000)
+        summary = span.summary()
+        assert summary["count"] == 100
+        assert summary["total_ms"] == pytest.approx(5050)
+        assert summary["p50_ms"] == pytest.approx(51)
+        assert summary["p95_ms"] == pytest.approx(96)
+        assert summary["max_ms"] == pytest.approx(100)
+
+    def test_disabled(self):
+        stats = Stats()
+        with stats.span("noop"):
+            pass
+        assert stats.report() == {}
+
+    def test_bad_trace_file(self, stats, tmp_path, monkeypatch):
+        monkeypatch.setattr(TmuxDirFacade, "_instance", None)
+        trace_file = str(tmp_path / "missing" / "trace.jsonl")
+        with pytest.raises(TmuxDirFacadeException):
+            TmuxDirFacade.instance({"base_dirs": [], "trace_file": trace_file})
+        assert stats._trace is None and stats._trace_path == ""
+
+    def test_timed(self, stats, tmp_path, monkeypatch):
+        monkeypatch.setenv("TMUXDIR_CONFIG_FOLDER", str(tmp_path))
+        dir_mngr = DirMngr([], [".git"])
+        dir_mngr.find_projects(str(tmp_path), [".git"])
+        dir_mngr.find_projects(str(tmp_path), [".git"])
+
+        @timed("fails")
+        def _fails():
+            raise ValueError()
+
+        with pytest.raises(ValueError):
+            _fails()
+        report = stats.report()
+        assert report["find_projects"]["count"] == 2
+        assert report["fails"]["count"] == 1
+
+    def test_trace_file(self, stats, tmp_path):
+        trace = tmp_path / "trace.jsonl"
+        stats.configure(True, str(trace))
+        with stats.span("a"):
+            pass
+        with stats.span("b"):
+            pass
+        stats.configure(True)
+        assert [json.loads(line)["span"] for line in trace.open()] == ["a", "b"]
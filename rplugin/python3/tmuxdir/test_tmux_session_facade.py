@@ -0,0 +1,239 @@
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tmuxdir.tmux_session_facade import (
+    TmuxFacadeException,
+    TmuxSessionFacade,
+    quote_arg,
+)
+from tmuxdir import prewarm
+from tmuxdir.tmuxdir_facade import TmuxDirFacade
+import pytest
+
+
+@pytest.fixture
+def tmux_server(tmp_path, monkeypatch) -> str:
+    if not shutil.which("tmux"):
+        pytest.skip("tmux isn't installed")
+    monkeypatch.setenv("TMUX_TMPDIR", str(tmp_path))
+    monkeypatch.delenv("TMUX", raising=False)
+    subprocess.check_call(["tmux", "new-session", "-d", "-s", "base"])
+    yield str(tmp_path)
+    subprocess.call(["tmux", "kill-server"], stderr=subprocess.DEVNULL)
+
+
+@pytest.fixture(params=[False, True], ids=["subprocess", "control_mode"])
+def tmuxf(tmux_server, request) -> TmuxSessionFacade:
+    facade = TmuxSessionFacade(control_mode=request.param)
+    yield facade
+    if facade._control:
+        facade._control.close()
+
+
+class TestTmuxSessionFacade:
+    def test_create_kill(self, tmuxf: TmuxSessionFacade):
+        tmuxf.create("proj", "sh", "/tmp", vim_args="")
+        assert set(tmuxf.sessions()) == {"base", "proj"}
+        tmuxf.kill("proj")
+        assert set(tmuxf.sessions()) == {"base"}
+        with pytest.raises(TmuxFacadeException):
+            tmuxf.kill("proj")
+
+    def test_control_mode_reconnect(self, tmux_server):
+        tmuxf = TmuxSessionFacade(control_mode=True)
+        assert set(tmuxf.sessions()) == {"base"}
+        assert tmuxf._control.is_connected()
+        tmuxf._control._proc.kill()
+        tmuxf._control._proc.wait()
+        tmuxf.create("proj", "sh", "/tmp", vim_args="")
+        assert set(tmuxf.sessions()) == {"base", "proj"}
+        tmuxf._control.close()
+
+    def test_control_mode_fallback(self, tmux_server):
+        tmuxf = TmuxSessionFacade(control_mode=True)
+        subprocess.check_call(["tmux", "kill-server"])
+        with pytest.raises(TmuxFacadeException):
+            tmuxf.sessions()
+        assert not tmuxf._control.is_connected()
+
+    def test_quote_arg(self, tmuxf: TmuxSessionFacade):
+        for arg in ("a b", "it's", 'a"b', "~/x;y", "$HOME", "\\"):
+            out = tmuxf._run_cmd(["tmux", "display-message", "-p", arg])
+            assert out.rstrip("\n") == arg
+        assert quote_arg("new-session") == "new-session"
+
+    def test_batch(self, tmuxf: TmuxSessionFacade, monkeypatch):
+        for name in ("a", "b"):
+            tmuxf.create(name, "sh", "/tmp", vim_args="")
+        popen = subprocess.Popen
+        calls = []
+
+        def _popen(*args, **kwargs):
+            calls.append(args[0])
+            return popen(*args, **kwargs)
+
+        monkeypatch.setattr(subprocess, "Popen", _popen)
+        batch = tmuxf.batch().kill("a").kill("nope").kill("b")
+        batch.add(["tmux", "display-message", "-p", "done"])
+        errors = batch.run()
+        assert [bool(err) for err in errors] == [False, True, False, False]
+        assert "nope" in errors[1].msg
+        assert batch.outputs[3] == "done\n"
+        assert len(calls) == (0 if tmuxf._control else 2)
+
+        monkeypatch.setattr(subprocess, "Popen", popen)
+        assert set(tmuxf.sessions()) == {"base"}
+
+    def test_session_metadata(self, tmuxf: TmuxSessionFacade, tmp_path):
+        path = tmp_path / "my repo:x"
+        path.mkdir()
+        tmuxf.create("my repo", "sh", str(path), vim_args="")
+        subprocess.check_call(["tmux", "split-window", "-t", "my repo", "sh"])
+        subprocess.check_call(["tmux", "new-window", "-t", "my repo", "sh"])
+        session = tmuxf.refresh()["my repo"]
+        assert (session.windows, session.panes) == (2, 3)
+        assert session.path == str(path)
+        assert session.attached == 0 and session.group == ""
+        assert session.activity >= session.created_epoch > 0
+
+    def test_batch_switch_not_attached(self, tmuxf: TmuxSessionFacade):
+        with pytest.raises(TmuxFacadeException):
+            tmuxf.batch().switch("base")
+
+    def test_sessions_cache(self, tmuxf: TmuxSessionFacade):
+        assert set(tmuxf.sessions()) == {"base"}
+        subprocess.check_call(["tmux", "new-session", "-d", "-s", "other"])
+        assert set(tmuxf.sessions()) == {"base"}
+        tmuxf.create("a", "sh", "/tmp", vim_args="")
+        tmuxf.batch().create("b", "sh", "/tmp", vim_args="").kill("base").run()
+        assert set(tmuxf.sessions()) == {"a", "b"}
+        assert set(tmuxf.refresh()) == {"a", "b", "other"}
+
+        tmuxf._session_cache_ttl = 0
+        subprocess.check_call(["tmux", "kill-session", "-t", "other"])
+        assert set(tmuxf.sessions()) == {"a", "b"}
+
+
+class TestTmuxDirFacade:
+    def test_next_session_name(self, tmux_server, monkeypatch):
+        monkeypatch.setenv("TMUXDIR_CONFIG_FOLDER", tmux_server)
+        tmux_dir = TmuxDirFacade([])
+        assert tmux_dir.next_session_name("~/repo") == "~/repo"
+        for name in ("~/repo", "~/repo-1", "~/repo-3", "~/repo-x", "~/repo-2-1"):
+            tmux_dir.create(name, "sh", "/tmp", vim_args="")
+        assert tmux_dir.next_session_name("~/repo") == "~/repo-2"
+        assert tmux_dir.next_session_name("~/repo-2") == "~/repo-2"
+        assert tmux_dir.next_session_name("~/repo-1") == "~/repo-1-1"
+
+    @pytest.mark.skipif(not shutil.which("tmux"), reason="tmux isn't installed")
+    def test_instance(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("TMUXDIR_CONFIG_FOLDER", str(tmp_path))
+        monkeypatch.setattr(TmuxDirFacade, "_instance", None)
+        settings = {"base_dirs": [str(tmp_path)], "root_markers": [".git"]}
+        tmux_dir = TmuxDirFacade.instance(settings)
+        assert TmuxDirFacade.instance(dict(settings)) is tmux_dir
+
+        # written by another process, reloaded without rebuilding
+        (tmp_path / "repo" / ".git").mkdir(parents=True)
+        other = TmuxDirFacade([str(tmp_path)])
+        other.add(str(tmp_path / "repo"))
+        assert tmux_dir.cfg_handler.is_stale()
+        assert TmuxDirFacade.instance(settings) is tmux_dir
+        assert not tmux_dir.cfg_handler.is_stale()
+        assert tmux_dir.dirs == other.dirs != {}
+
+        settings["root_markers"] = [".hg"]
+        assert TmuxDirFacade.instance(settings) is not tmux_dir
+
+        # built once when job workers race for it
+        settings["root_markers"] = [".svn"]
+        with ThreadPoolExecutor(4) as pool:
+            built = list(pool.map(TmuxDirFacade.instance, [settings] * 4))
+        assert len({id(facade) for facade in built}) == 1
+
+    def test_session_index(self, tmux_server, monkeypatch):
+        monkeypatch.setenv("TMUXDIR_CONFIG_FOLDER", tmux_server)
+        monkeypatch.setenv("HOME", tmux_server)
+        os.makedirs(os.path.join(tmux_server, "repo", "a.b"))
+        tmux_dir = TmuxDirFacade([])
+        project = os.path.join(tmux_server, "repo", "a.b")
+        tmux_dir.create("work", "sh", project, vim_args="")
+        subprocess.check_call(["tmux", "new-session", "-d", "-s", "~/repo/a-b"])
+
+        index = tmux_dir.refresh() and tmux_dir.session_index()
+        assert index.dir_sessions("~/repo/a.b") == ["~/repo/a-b", "work"]
+        assert index.session_dir("work") == "~/repo/a.b"
+        assert index.dir_sessions("~/other") == []
+        assert tmux_dir.session_index() is index
+
+        tmux_dir.kill("work")
+        index = tmux_dir.session_index()
+        assert index.dir_sessions("~/repo/a.b") == ["~/repo/a-b"]
+
+    def test_pane_index(self, tmuxf: TmuxSessionFacade, tmp_path):
+        for path in ("repo/src/deep", "repo-2", "other"):
+            os.makedirs(str(tmp_path / path))
+        tmuxf.create("a", "sh", str(tmp_path / "repo" / "src" / "deep"), vim_args="")
+        tmuxf.create("b", "sh", str(tmp_path / "other"), vim_args="")
+        index = tmuxf.pane_index()
+        pane = index.find(str(tmp_path / "repo"))
+        assert pane and pane.session_name == "a"
+        assert pane.path == str(tmp_path / "repo" / "src" / "deep")
+        assert index.find(str(tmp_path / "repo-2")) is None
+        assert index.find(str(tmp_path / "other")).target == "b:0.0"
+
+        errors = tmuxf.batch().select(pane).run()
+        assert errors == [None, None]
+
+    def test_prewarm(self, tmux_server, tmp_path, monkeypatch):
+        monkeypatch.setenv("TMUXDIR_CONFIG_FOLDER", str(tmp_path))
+        for name in ("a", "b", "c"):
+            (tmp_path / name).mkdir()
+        tmux_dir = TmuxDirFacade([], prewarm=2)
+        prewarmer = tmux_dir.prewarmer
+        monkeypatch.setattr(prewarmer, "schedule", lambda: None)
+        prewarmer.vim_bin_path, prewarmer.vim_args = "sh", ""
+        for name, opens in (("a", 3), ("b", 1), ("c", 2)):
+            for _ in range(opens):
+                prewarmer.record_open(str(tmp_path / name))
+
+        # fresh editors are estimated from the warm ones, the first one alone
+        monkeypatch.setattr(prewarm, "rss_mb", lambda pid: 100.0)
+        prewarmer.memory_budget_mb = 150.0
+        a, c = (tmux_dir.dir_to_session_name(str(tmp_path / n)) for n in "ac")
+        assert prewarmer.warm() == ([a], [])
+        assert tmux_dir.sessions()[a].prewarmed
+        assert prewarmer.warm() == ([], [])
+        prewarmer.memory_budget_mb = 200.0
+        assert prewarmer.warm() == ([c], [])
+        assert prewarmer.warm() == ([], [])
+
+        batch = tmux_dir.batch()
+        prewarmer.claim(batch, a)
+        assert batch.run() == [None]
+        assert not tmux_dir.refresh()[a].prewarmed
+
+        # a client attached to it some other way, it's claimed, not killed
+        refresh = tmux_dir.refresh
+
+        def _refresh():
+            sessions = refresh()
+            sessions[c].last_attached = int(time.time())
+            return sessions
+
+        monkeypatch.setattr(tmux_dir, "refresh", _refresh)
+        prewarmer.idle_timeout = -1
+        assert prewarmer.warm() == ([], [])
+        assert not tmux_dir.sessions()[c].prewarmed
+        monkeypatch.setattr(tmux_dir, "refresh", refresh)
+
+        mark = ["tmux", "set-option", "-t", c, prewarm.PREWARM_OPTION, "1"]
+        assert tmux_dir.batch().add(mark).run() == [None]
+        assert prewarmer.warm() == ([], [c])
+        assert str(tmp_path / "c") not in prewarmer.top_dirs()
+        assert set(tmux_dir.sessions()) == {"base", a}
+
+        reloaded = TmuxDirFacade([], prewarm=2).prewarmer
+        assert reloaded.counts == prewarmer.counts
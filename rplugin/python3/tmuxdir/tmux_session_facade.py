@@ -2,8 +2,13 @@
 # -*- coding: utf-8 -*-
 import subprocess
 import os
+import threading
 import time
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
+from tmuxdir.stats import STATS
+
+
+_BATCH_MARK = "tmuxdir-batch-{}"
 
 
 class TmuxFacadeException(Exception):
@@ -20,23 +25,380 @@ class TmuxFacadeBinException(TmuxFacadeException):
         super().__init__(msg)
 
 
+class TmuxControlClosedException(TmuxFacadeException):
+    def __init__(self, msg):
+        super().__init__(msg)
+
+
 class TmuxSession:
 
-    """TmuxSession abstraction."""
+    """TmuxSession abstraction.
+
+    activity is the epoch of its last activity, group the name of its
+    session group, empty if it isn't grouped, pid the pid of its active pane,
+    prewarmed the epoch it was pre-warmed at, 0 if it wasn't, see
+    SessionPrewarmer, and last_attached the epoch a client last attached to
+    it, 0 if none ever did.
+    """
+
+    __slots__ = (
+        "name",
+        "created_epoch",
+        "attached",
+        "windows",
+        "panes",
+        "activity",
+        "group",
+        "pid",
+        "prewarmed",
+        "last_attached",
+        "path",
+    )
 
-    def __init__(self, name, created_epoch, attached) -> None:
+    def __init__(
+        self,
+        name,
+        created_epoch,
+        attached,
+        path="",
+        windows=0,
+        panes=0,
+        activity=0,
+        group="",
+        pid=0,
+        prewarmed=0,
+        last_attached=0,
+    ) -> None:
         self.name = name
-        self.created_epoch = created_epoch
-        self.created_time = time.strftime(
-            "%Y-%m-%d %H:%M:%S", time.localtime(int(created_epoch))
+        self.created_epoch = int(created_epoch)
+        self.attached = int(attached)
+        self.windows = windows
+        self.panes = panes
+        self.activity = activity or self.created_epoch
+        self.group = group
+        self.pid = pid
+        self.prewarmed = prewarmed
+        self.last_attached = last_attached
+        self.path = path
+
+    @property
+    def created_time(self) -> str:
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.created_epoch))
+
+    def __repr__(self):
+        return "TmuxSession(name={}, created_time={}, attached={}, path={})".format(
+            self.name, self.created_time, self.attached, self.path
         )
-        self.attached = attached
+
+
+# session option marking pre-warmed sessions, see SessionPrewarmer
+PREWARM_OPTION = "@tmuxdir_prewarm"
+
+# user session options listed with sessions, mapped to the TmuxSession
+# attribute they're parsed into, as ints, 0 if they're unset
+_SESSION_OPTIONS = {PREWARM_OPTION: "prewarmed"}
+
+# session names can't have ':' nor '.', tmux replaces them, so ':' splits the
+# fields unambiguously as long as the path, which can have them, is last.
+_SESSION_FORMAT = ":".join(
+    [
+        "#{session_name}",
+        "#{session_created}",
+        "#{session_attached}",
+        "#{session_windows}",
+        "#{W:#{window_panes} }",
+        "#{session_activity}",
+        "#{session_group}",
+        "#{pane_pid}",
+        "#{" + PREWARM_OPTION + "}",
+        "#{session_last_attached}",
+        "#{session_path}",
+    ]
+)
+
+
+def parse_sessions(out: str) -> Dict[str, TmuxSession]:
+    """Parse list-sessions output in _SESSION_FORMAT.
+    Raises TmuxFacadeException if a line can't be parsed."""
+    sessions: Dict[str, TmuxSession] = {}
+    for line in out.splitlines():
+        fields = line.split(":", 10)
+        try:
+            (
+                name,
+                created,
+                attached,
+                windows,
+                panes,
+                activity,
+                group,
+                pid,
+                prewarmed,
+                last_attached,
+                path,
+            ) = fields
+            sessions[name] = TmuxSession(
+                name,
+                created,
+                attached,
+                path,
+                int(windows),
+                sum(map(int, panes.split())),
+                int(activity),
+                group,
+                int(pid or 0),
+                int(prewarmed or 0),
+                int(last_attached or 0),
+            )
+        except ValueError:
+            raise TmuxFacadeException("Failed to parse tmux list-sessions")
+    return sessions
+
+
+class TmuxPane:
+
+    """TmuxPane abstraction."""
+
+    __slots__ = ("session_name", "window_index", "pane_index", "path")
+
+    def __init__(self, session_name, window_index, pane_index, path) -> None:
+        self.session_name = session_name
+        self.window_index = window_index
+        self.pane_index = pane_index
+        self.path = path
+
+    @property
+    def window_target(self) -> str:
+        return "{}:{}".format(self.session_name, self.window_index)
+
+    @property
+    def target(self) -> str:
+        return "{}:{}.{}".format(self.session_name, self.window_index, self.pane_index)
 
     def __repr__(self):
-        return "TmuxSession(name={}, created_time={}, attached={})".format(
-            self.name, self.created_time, self.attached
+        return "TmuxPane(target={}, path={})".format(self.target, self.path)
+
+
+class PaneIndex:
+
+    """Prefix tree of pane current paths, one node per path component.
+
+    Every node keeps the first pane inserted at or below it, so finding a
+    pane inside a directory only walks its path components.
+    """
+
+    def __init__(self, panes: List[TmuxPane] = []) -> None:
+        """Constructor of PaneIndex."""
+        # node: [first pane at or below it, children by path component]
+        self._root: list = [None, {}]
+        for pane in panes:
+            self.add(pane)
+
+    @staticmethod
+    def _parts(path: str) -> List[str]:
+        return [part for part in os.path.normpath(path).split(os.path.sep) if part]
+
+    def add(self, pane: TmuxPane) -> None:
+        node = self._root
+        for part in self._parts(pane.path):
+            if node[0] is None:
+                node[0] = pane
+            node = node[1].setdefault(part, [None, {}])
+        if node[0] is None:
+            node[0] = pane
+
+    def find(self, dir_path: str) -> Optional[TmuxPane]:
+        """A pane whose current path is dir_path or below it, None if
+        there's none."""
+        node = self._root
+        for part in self._parts(dir_path):
+            node = node[1].get(part)
+            if node is None:
+                return None
+        return node[0]
+
+
+class TmuxControlClient:
+
+    """Long lived tmux control mode (tmux -C) client.
+
+    Commands are written on its stdin and each reply is read from the
+    %begin/%end (or %error) block that tmux wraps its output with.
+    Notifications sent between blocks are skipped.
+    """
+
+    def __init__(self) -> None:
+        """Constructor of TmuxControlClient."""
+        self._proc: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+
+    def is_connected(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def connect(self) -> None:
+        """Attach a control mode client to the running tmux server.
+        Raises TmuxControlClosedException if it can't attach."""
+        self.close()
+        try:
+            self._proc = subprocess.Popen(
+                ["tmux", "-C", "attach-session"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                universal_newlines=True,
+            )
+        except OSError as e:
+            raise TmuxControlClosedException(str(e))
+        # wait until it's attached, output notifications are turned off
+        # since they'd pile up between commands
+        for line in self._proc.stdout:
+            if line.startswith("%session-changed "):
+                break
+        else:
+            raise TmuxControlClosedException("tmux control client exited")
+        try:
+            self._run(["refresh-client", "-f", "no-output"])
+        except TmuxFacadeException:
+            pass
+
+    def close(self) -> None:
+        if self._proc is None:
+            return
+        try:
+            self._proc.stdin.close()
+            self._proc.wait(timeout=1)
+        except (OSError, subprocess.TimeoutExpired):
+            self._proc.kill()
+        self._proc = None
+
+    def run(self, args: List[str]) -> str:
+        """Run a tmux command, args without the tmux binary.
+        Raises TmuxFacadeException if an err occurs, and
+        TmuxControlClosedException if the connection is lost."""
+        with self._lock:
+            if not self.is_connected():
+                raise TmuxControlClosedException("tmux control client isn't running")
+            return self._run(args)
+
+    def run_many(
+        self, args_list: List[List[str]]
+    ) -> List[Tuple[str, Optional[TmuxFacadeException]]]:
+        """Run tmux commands, writing them all before reading their replies.
+        Return the output and error of each command.
+        Raises TmuxControlClosedException if the connection is lost."""
+        with self._lock:
+            if not self.is_connected():
+                raise TmuxControlClosedException("tmux control client isn't running")
+            for args in args_list:
+                self._write(args)
+            results: List[Tuple[str, Optional[TmuxFacadeException]]] = []
+            for _ in args_list:
+                try:
+                    results.append((self._read_block(), None))
+                except TmuxControlClosedException:
+                    raise
+                except TmuxFacadeException as e:
+                    results.append(("", e))
+            return results
+
+    def _run(self, args: List[str]) -> str:
+        self._write(args)
+        return self._read_block()
+
+    def _write(self, args: List[str]) -> None:
+        try:
+            self._proc.stdin.write(" ".join(quote_arg(arg) for arg in args) + "\n")
+            self._proc.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise TmuxControlClosedException(str(e))
+
+    def _read_block(self) -> str:
+        """Read the reply block of the next command sent on stdin, blocks of
+        other commands (flags 0), such as attach-session's, are skipped.
+        Raises TmuxFacadeException if it's an %error block."""
+        lines: List[str] = []
+        in_block = False
+        for line in self._proc.stdout:
+            line = line.rstrip("\n")
+            if not in_block:
+                if line.startswith("%begin "):
+                    in_block = True
+                    lines = []
+            elif line.startswith(("%end ", "%error ")):
+                in_block = False
+                if line.split(" ")[-1] != "1":
+                    continue
+                out = "".join(line + "\n" for line in lines)
+                if line.startswith("%error "):
+                    raise TmuxFacadeException(out)
+                return out
+            else:
+                lines.append(line)
+        raise TmuxControlClosedException("tmux control client exited")
+
+
+def quote_arg(arg: str) -> str:
+    """Quote an argument for the tmux command parser, single quoted pieces
+    are taken literally and single quotes themselves are double quoted."""
+    if arg and all(c.isalnum() or c in "-_./:=%@,+" for c in arg):
+        return arg
+    return "\"'\"".join("'{}'".format(piece) for piece in arg.split("'"))
+
+
+class TmuxBatch:
+
+    """Builder of tmux commands that are run together, in a single tmux
+    process, or pipelined through the control mode client.
+
+    Unlike a plain tmux command sequence, a failing command doesn't stop the
+    next ones, and each command gets its own error.
+    """
+
+    def __init__(self, facade: "TmuxSessionFacade") -> None:
+        """Constructor of TmuxBatch."""
+        self._facade = facade
+        self.cmds: List[List[str]] = []
+        self.outputs: List[str] = []
+
+    def add(self, cmd: List[str]) -> "TmuxBatch":
+        """Add a tmux command, including the tmux binary."""
+        self.cmds.append(cmd)
+        return self
+
+    def create(
+        self,
+        session_name: str,
+        vim_bin_path: str,
+        start_directory: str,
+        vim_args: str = "e .",
+    ) -> "TmuxBatch":
+        return self.add(
+            self._facade._create_cmd(
+                session_name, vim_bin_path, start_directory, vim_args
+            )
         )
 
+    def switch(self, session_name: str) -> "TmuxBatch":
+        """Raises TmuxFacadeException if the local client isn't attached."""
+        return self.add(self._facade._switch_cmd(session_name))
+
+    def kill(self, session_name: str) -> "TmuxBatch":
+        return self.add(self._facade._kill_cmd(session_name))
+
+    def select(self, pane: TmuxPane) -> "TmuxBatch":
+        """Select the window and pane of a pane, within its session."""
+        for cmd in self._facade._select_cmds(pane):
+            self.add(cmd)
+        return self
+
+    def run(self) -> List[Optional[TmuxFacadeException]]:
+        """Run all commands, return the error of each one, None if it
+        succeeded. Their outputs are kept on outputs."""
+        with STATS.span("_run_cmds batch"):
+            results = self._facade._run_cmds(self.cmds)
+        self.outputs = [out for out, _ in results]
+        return [err for _, err in results]
+
 
 class TmuxSessionFacade:
 
@@ -46,28 +408,92 @@ class TmuxSessionFacade:
     tmux attaching won't be supported since tmux sessions inside nvim/vim
     is not desirable, which means you should have a tmux instance running
     to use this class.
+
+    With control_mode, commands are sent through a single long lived tmux
+    control mode client instead of forking a tmux process per command, it
+    reconnects if the tmux server restarts and falls back to forking if it
+    can't connect. switch-client always forks, since in control mode it would
+    switch the control client itself.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, control_mode=False, session_cache_ttl=1.0) -> None:
+        self._control: Optional[TmuxControlClient] = (
+            TmuxControlClient() if control_mode else None
+        )
+        self._session_cache_ttl = session_cache_ttl
+        self._snapshot: Optional[Dict[str, TmuxSession]] = None
+        self._snapshot_time = 0.0
+        # bumped whenever the snapshot changes, to invalidate derived indexes
+        self._snapshot_version = 0
         self._check_tmux_bin()
 
     def sessions(self) -> Dict[str, TmuxSession]:
-        """Get existing tmux sessions."""
-        sessions: Dict[str, TmuxSession] = {}
+        """Get existing tmux sessions.
+
+        Sessions are cached for session_cache_ttl seconds, sessions created or
+        killed through this facade update the cache right away."""
+        if (
+            self._snapshot is not None
+            and time.monotonic() - self._snapshot_time < self._session_cache_ttl
+        ):
+            return dict(self._snapshot)
+        return self.refresh()
+
+    def refresh(self) -> Dict[str, TmuxSession]:
+        """Get existing tmux sessions, refreshing the cached snapshot."""
+        out = self._run_cmd(["tmux", "list-sessions", "-F", _SESSION_FORMAT])
+        sessions = parse_sessions(out)
+        self._snapshot = sessions
+        self._snapshot_time = time.monotonic()
+        self._snapshot_version += 1
+        return dict(sessions)
+
+    def panes(self) -> List[TmuxPane]:
+        """Get all panes of all sessions, with a single list-panes."""
+        panes = []
         out = self._run_cmd(
             [
                 "tmux",
-                "list-sessions",
+                "list-panes",
+                "-a",
                 "-F",
-                "#{session_name} #{session_created} #{session_attached}",
+                "#{session_name}:#{window_index}:#{pane_index}:#{pane_current_path}",
             ]
         )
         for line in out.splitlines():
-            words = line.strip().split()
-            if len(words) != 3:
-                raise TmuxFacadeException("Failed to parse tmux list-sessions")
-            sessions[words[0]] = TmuxSession(words[0], words[1], words[2])
-        return sessions
+            # session names can't have ':', the path is last so it can
+            fields = line.split(":", 3)
+            if len(fields) != 4:
+                raise TmuxFacadeException("Failed to parse tmux list-panes")
+            panes.append(TmuxPane(*fields))
+        return panes
+
+    def pane_index(self) -> PaneIndex:
+        """PaneIndex of all panes, from a single list-panes."""
+        return PaneIndex(self.panes())
+
+    def _update_snapshot(self, cmds: List[str]) -> None:
+        """Write through a succeeded tmux command on the cached snapshot."""
+        if self._snapshot is None:
+            return
+        if cmds[1] == "new-session":
+            name = cmds[cmds.index("-s") + 1]
+            path = cmds[cmds.index("-c") + 1] if "-c" in cmds else ""
+            self._snapshot[name] = TmuxSession(
+                name, int(time.time()), 0, path, windows=1, panes=1
+            )
+        elif cmds[1] == "kill-session":
+            self._snapshot.pop(cmds[cmds.index("-t") + 1], None)
+        elif cmds[1] == "set-option" and "-t" in cmds:
+            unset = "-u" in cmds
+            attr = _SESSION_OPTIONS.get(cmds[-1] if unset else cmds[-2])
+            session = self._snapshot.get(cmds[cmds.index("-t") + 1])
+            if not attr or not session:
+                return
+            setattr(session, attr, 0 if unset else int(cmds[-1]))
+        else:
+            return
+        self._snapshot_version += 1
 
     def is_attached(self) -> bool:
         """Check if the local client is attached to tmux."""
@@ -75,6 +501,10 @@ class TmuxSessionFacade:
             return True
         return False
 
+    def batch(self) -> TmuxBatch:
+        """Start a batch of tmux commands."""
+        return TmuxBatch(self)
+
     def create(
         self,
         session_name: str,
@@ -85,6 +515,29 @@ class TmuxSessionFacade:
         """Create a detached tmux session with nvim/vim started
         Raises TmuxFacadeException if an err occurs."""
 
+        self._run_cmd(
+            self._create_cmd(session_name, vim_bin_path, start_directory, vim_args)
+        )
+
+    def switch(self, session_name: str) -> None:
+        """Switch to a tmux session
+        Raises TmuxFacadeException if an err occurs."""
+
+        self._run_cmd(self._switch_cmd(session_name))
+
+    def kill(self, session_name: str) -> None:
+        """Kill a tmux session
+        Raises TmuxFacadeException if an err occurs."""
+
+        self._run_cmd(self._kill_cmd(session_name))
+
+    def _create_cmd(
+        self,
+        session_name: str,
+        vim_bin_path: str,
+        start_directory: str,
+        vim_args: str = "e .",
+    ) -> List[str]:
         _cmd = [
             "tmux",
             "new-session",
@@ -97,24 +550,24 @@ class TmuxSessionFacade:
         ]
         if vim_args:
             _cmd.extend(["-c", vim_args])
-        self._run_cmd(_cmd)
-
-    def switch(self, session_name: str) -> None:
-        """Switch to a tmux session
-        Raises TmuxFacadeException if an err occurs."""
+        return _cmd
 
+    def _switch_cmd(self, session_name: str) -> List[str]:
         if not self.is_attached():
             raise TmuxFacadeException(
                 "Please, make sure you have a tmux session attached before"
                 " trying to switch."
             )
-        self._run_cmd(["tmux", "switch-client", "-t", session_name])
+        return ["tmux", "switch-client", "-t", session_name]
 
-    def kill(self, session_name: str) -> None:
-        """Kill a tmux session
-        Raises TmuxFacadeException if an err occurs."""
+    def _kill_cmd(self, session_name: str) -> List[str]:
+        return ["tmux", "kill-session", "-t", session_name]
 
-        self._run_cmd(["tmux", "kill-session", "-t", session_name])
+    def _select_cmds(self, pane: TmuxPane) -> List[List[str]]:
+        return [
+            ["tmux", "select-window", "-t", pane.window_target],
+            ["tmux", "select-pane", "-t", pane.target],
+        ]
 
     def _check_tmux_bin(self) -> bool:
         """Check if tmux binary can be found in the $PATH
@@ -129,6 +582,106 @@ class TmuxSessionFacade:
             )
 
     def _run_cmd(self, cmds: List[str]):
+        """Run tmux commands via the control mode client or subprocess.
+        Raises TmuxFacadeException if an err occurs."""
+
+        with STATS.span("_run_cmd " + cmds[1]):
+            out, err = self._run_cmds([cmds])[0]
+        if err:
+            raise err
+        return out
+
+    def _uses_control(self, cmds: List[str]) -> bool:
+        return bool(self._control) and cmds[1] not in ("-V", "switch-client")
+
+    def _run_cmds(
+        self, cmds_list: List[List[str]]
+    ) -> List[Tuple[str, Optional[TmuxFacadeException]]]:
+        """Run a list of tmux commands, in as few round trips as possible.
+        Return the output and error of each command."""
+
+        results: List[Tuple[str, Optional[TmuxFacadeException]]] = []
+        i = 0
+        while i < len(cmds_list):
+            uses_control = self._uses_control(cmds_list[i])
+            j = i + 1
+            while (
+                j < len(cmds_list) and self._uses_control(cmds_list[j]) == uses_control
+            ):
+                j += 1
+            batch = cmds_list[i:j]
+            batch_results = self._run_control(batch) if uses_control else None
+            if batch_results is None:
+                batch_results = self._run_subprocess_batch(batch)
+            results.extend(batch_results)
+            i = j
+        for cmds, (_, err) in zip(cmds_list, results):
+            if not err:
+                self._update_snapshot(cmds)
+        return results
+
+    def _run_control(
+        self, cmds_list: List[List[str]]
+    ) -> Optional[List[Tuple[str, Optional[TmuxFacadeException]]]]:
+        """Run tmux commands via the control mode client, reconnecting once.
+        Return None if the control mode client can't be used."""
+
+        for _ in range(2):
+            try:
+                if not self._control.is_connected():
+                    self._control.connect()
+                return self._control.run_many([cmds[1:] for cmds in cmds_list])
+            except TmuxControlClosedException:
+                self._control.close()
+        return None
+
+    def _run_subprocess_batch(
+        self, cmds_list: List[List[str]]
+    ) -> List[Tuple[str, Optional[TmuxFacadeException]]]:
+        """Run tmux commands in a single tmux process, separated by ';'.
+
+        A marker is printed after each command to split their outputs and to
+        find out where tmux stopped if one of them failed, in which case the
+        remaining commands are run in a new process."""
+
+        if len(cmds_list) == 1:
+            try:
+                return [(self._run_subprocess(cmds_list[0]), None)]
+            except TmuxFacadeException as e:
+                return [("", e)]
+
+        results: List[Tuple[str, Optional[TmuxFacadeException]]] = []
+        while cmds_list:
+            argv = ["tmux"]
+            for i, cmds in enumerate(cmds_list):
+                argv.extend(cmds[1:])
+                argv.extend([";", "display-message", "-p", _BATCH_MARK.format(i), ";"])
+            try:
+                out, err = subprocess.Popen(
+                    argv[:-1],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    universal_newlines=True,
+                ).communicate()
+            except OSError as e:
+                return results + [("", TmuxFacadeException(str(e)))] * len(cmds_list)
+
+            done = 0
+            chunk = ""
+            for line in out.splitlines(keepends=True):
+                if line.rstrip("\n") == _BATCH_MARK.format(done):
+                    results.append((chunk, None))
+                    chunk = ""
+                    done += 1
+                else:
+                    chunk += line
+            if done == len(cmds_list):
+                return results
+            results.append((chunk, TmuxFacadeException(err)))
+            cmds_list = cmds_list[done + 1 :]
+        return results
+
+    def _run_subprocess(self, cmds: List[str]):
         """Run tmux commands via subprocess.
         Raises TmuxFacadeException if an err occurs."""
 
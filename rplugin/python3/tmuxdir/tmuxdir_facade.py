@@ -1,9 +1,29 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from typing import List
-from tmuxdir.tmux_session_facade import TmuxSessionFacade, TmuxFacadeException
-from tmuxdir.dirmngr import DirMngr
+import contextlib
+import threading
+from typing import (
+    Any,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from tmuxdir.tmux_session_facade import (
+    TmuxFacadeException,
+    TmuxSession,
+    TmuxSessionFacade,
+)
+from tmuxdir.config_handler import ConfigHandler
+from tmuxdir.daemon import DaemonClient, DaemonException, socket_path
+from tmuxdir.dirmngr import DirMngr, ProjectStore
+from tmuxdir.markers import MarkerException, RootMarker
+from tmuxdir.prewarm import SessionPrewarmer
+from tmuxdir.stats import STATS
 
 
 class TmuxDirFacadeException(TmuxFacadeException):
@@ -15,30 +35,324 @@ class TmuxDirFacadeException(TmuxFacadeException):
         super().__init__(message)
 
 
-class TmuxDirFacade(TmuxSessionFacade, DirMngr):
+class SessionIndex:
 
-    """TmuxDirFacade Singleton."""
+    """Project dirs mapped to the names of their tmux sessions and back, built
+    from a single sessions snapshot.
 
-    _instance = None
+    A session belongs to the dir it was started in, its session_path, or to
+    the dir it's named after, see dir_to_session_name.
+    """
 
-    def __new__(cls, *args, **kwargs):
-        if not cls._instance:
-            cls._instance = object.__new__(TmuxDirFacade)
-        return cls._instance
+    def __init__(
+        self, sessions: Dict[str, TmuxSession], project_dirs: ProjectStore
+    ) -> None:
+        """Constructor of SessionIndex."""
+        self.sessions = sessions
+        self._project_dirs = project_dirs
+        self._dir_sessions: Dict[str, List[str]] = {}
+        self._session_dirs: Dict[str, str] = {}
+        for name, session in sessions.items():
+            if session.path:
+                dir_path = project_dirs.display(session.path)
+                self._dir_sessions.setdefault(dir_path, []).append(name)
+                self._session_dirs[name] = dir_path
+
+    def dir_sessions(self, dir_path: str) -> List[str]:
+        """Names of the sessions of a dir, the one named after it first."""
+        names = list(self._dir_sessions.get(dir_path, []))
+        session_name = self._project_dirs.get(dir_path).session_name
+        if session_name in self.sessions:
+            if session_name in names:
+                names.remove(session_name)
+            names.insert(0, session_name)
+        return names
+
+    def session_dir(self, session_name: str) -> Optional[str]:
+        """~ relative dir a session was started in, None if it's unknown."""
+        return self._session_dirs.get(session_name)
+
+
+class DaemonDirMngr:
+
+    """Project dirs owned by the tmuxdir daemon, see DaemonServer, so a single
+    scan and a single writer of the dirs config serve every editor. The
+    daemon is started on first use if it isn't running.
+
+    It has the DirMngr methods TmuxDirFacade uses, forwarded to the DirMngr
+    of the daemon for dir_settings, its keyword arguments.
+    """
+
+    def __init__(self, dir_settings: Dict[str, Any]) -> None:
+        """Constructor of DaemonDirMngr."""
+        self._dir_settings = dir_settings
+        self.client = DaemonClient(socket_path())
+        self.project_dirs = ProjectStore()
+        self.cfg_handler = ConfigHandler()
+
+    def _call(self, method: str, *args: Any) -> Any:
+        try:
+            return self.client.call(method, self._dir_settings, *args)
+        except DaemonException as e:
+            raise TmuxDirFacadeException(e.msg)
+
+    @property
+    def dirs(self) -> Dict[str, str]:
+        return {d: d for d in self._call("dirs")}
+
+    @property
+    def ignored_dirs(self) -> Dict[str, str]:
+        return {d: d for d in self._call("ignored_dirs")}
+
+    def close(self) -> None:
+        """The daemon outlives its editors."""
+
+    def reload_dirs(self) -> None:
+        """The daemon reloads dirs itself."""
+
+    @contextlib.contextmanager
+    def deferred_save(self) -> Iterator[None]:
+        """The daemon serializes saves itself."""
+        yield
+
+    def list_dirs(self) -> List[str]:
+        return self._call("list_dirs")
+
+    def iter_dirs(self) -> Iterator[str]:
+        return iter(self.list_dirs())
+
+    def cached_dirs(self) -> List[str]:
+        return self._call("cached_dirs")
+
+    def scan_status(self) -> Dict[str, Any]:
+        return self._call("scan_status")
+
+    def add(
+        self, input_dir: str, cancelled: Optional[threading.Event] = None
+    ) -> List[str]:
+        """The daemon's walk can't be cancelled once it's requested."""
+        if cancelled is not None and cancelled.is_set():
+            return []
+        return self._call("add", input_dir)
+
+    def _add(self, input_dir: str) -> str:
+        return self._call("add_dir", input_dir)
+
+    def ignore(self, input_dir: str) -> bool:
+        return self._call("ignore", input_dir)
+
+    def clear_added_dir(self, input_dir: str) -> bool:
+        return self._call("clear_added_dir", input_dir)
+
+    def clear_added_dirs(self) -> bool:
+        return self._call("clear_added_dirs")
+
+    def clear_ignored_dir(self, input_dir: str) -> bool:
+        return self._call("clear_ignored_dir", input_dir)
+
+    def clear_ignored_dirs(self) -> bool:
+        return self._call("clear_ignored_dirs")
+
+
+class TmuxDirFacade(TmuxSessionFacade):
+
+    """TmuxDirFacade.
+
+    tmux sessions of project dirs, the dirs being managed by dir_mngr, a
+    DirMngr, or a DaemonDirMngr with the daemon setting.
+
+    A single instance is meant to be shared per nvim process through
+    TmuxDirFacade.instance(settings), see TmuxdirSettings().
+    """
+
+    _instance: Optional["TmuxDirFacade"] = None
+    _instance_key: Optional[Tuple] = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls, settings: Dict[str, Any]) -> "TmuxDirFacade":
+        """Shared TmuxDirFacade, built lazily with settings keyword arguments.
+
+        It's only rebuilt when settings change, and its persisted dirs are only
+        reloaded when the config has been written by someone else. The stats
+        and trace_file settings configure STATS instead."""
+
+        settings = dict(settings)
+        trace_file = settings.pop("trace_file", "")
+        stats = settings.pop("stats", False)
+        key = tuple(
+            (name, tuple(value) if isinstance(value, list) else value)
+            for name, value in sorted(settings.items())
+        )
+        # job workers call it off the nvim thread too
+        with cls._instance_lock:
+            try:
+                STATS.configure(stats, trace_file)
+            except OSError as e:
+                raise TmuxDirFacadeException(
+                    "Can't open trace file '{}': {}".format(trace_file, e.strerror)
+                )
+            if cls._instance and cls._instance_key == key:
+                cls._instance.reload_dirs()
+                return cls._instance
+            if cls._instance:
+                cls._instance.close()
+                cls._instance = None
+            cls._instance = cls(**settings)
+            cls._instance_key = key
+            return cls._instance
 
     def __init__(
-        self, base_dirs: List[str], root_markers: List[str] = [".git"], eager_mode=False
+        self,
+        base_dirs: List[str],
+        root_markers: List[RootMarker] = [".git"],
+        eager_mode=False,
+        scan_workers=1,
+        watch_mode="off",
+        control_mode=False,
+        session_cache_ttl=1.0,
+        exclude_patterns: List[str] = [],
+        stop_at_projects=False,
+        scan_budget_ms=0,
+        git_discovery=False,
+        prewarm=0,
+        prewarm_idle_timeout=1800.0,
+        prewarm_memory_mb=1024.0,
+        daemon=False,
     ) -> None:
         """Constructor of TmuxDirFacade."""
-        TmuxSessionFacade.__init__(self)
-        DirMngr.__init__(
-            self, base_dirs=base_dirs, root_markers=root_markers, eager_mode=eager_mode
+        TmuxSessionFacade.__init__(
+            self, control_mode=control_mode, session_cache_ttl=session_cache_ttl
+        )
+        self._session_index: Optional[SessionIndex] = None
+        self._session_index_version = -1
+        dir_settings = dict(
+            base_dirs=base_dirs,
+            root_markers=root_markers,
+            eager_mode=eager_mode,
+            scan_workers=scan_workers,
+            watch_mode=watch_mode,
+            exclude_patterns=exclude_patterns,
+            stop_at_projects=stop_at_projects,
+            scan_budget_ms=scan_budget_ms,
+            git_discovery=git_discovery,
+        )
+        self.dir_mngr: Union[DirMngr, DaemonDirMngr]
+        if daemon:
+            self.dir_mngr = DaemonDirMngr(dir_settings)
+        else:
+            try:
+                self.dir_mngr = DirMngr(**dir_settings)
+            except MarkerException as e:
+                raise TmuxDirFacadeException(e.msg)
+        self.prewarmer = self._prewarmer(
+            prewarm, prewarm_idle_timeout, prewarm_memory_mb
         )
 
+    def _prewarmer(
+        self, prewarm: int, idle_timeout: float, memory_budget_mb: float
+    ) -> Optional[SessionPrewarmer]:
+        if not prewarm:
+            return None
+        return SessionPrewarmer(
+            self,
+            pool_size=prewarm,
+            idle_timeout=idle_timeout,
+            memory_budget_mb=memory_budget_mb,
+        )
+
+    def close(self) -> None:
+        """Stop the project watcher and the tmux control mode client."""
+        self.dir_mngr.close()
+        if self._control:
+            self._control.close()
+
+    @property
+    def dirs(self) -> Dict[str, str]:
+        return self.dir_mngr.dirs
+
+    @property
+    def ignored_dirs(self) -> Dict[str, str]:
+        return self.dir_mngr.ignored_dirs
+
+    @property
+    def project_dirs(self) -> ProjectStore:
+        return self.dir_mngr.project_dirs
+
+    @property
+    def cfg_handler(self) -> ConfigHandler:
+        return self.dir_mngr.cfg_handler
+
+    def reload_dirs(self) -> None:
+        self.dir_mngr.reload_dirs()
+
+    def deferred_save(self) -> ContextManager[None]:
+        return self.dir_mngr.deferred_save()
+
+    def list_dirs(self) -> List[str]:
+        return self.dir_mngr.list_dirs()
+
+    def iter_dirs(self) -> Iterator[str]:
+        return self.dir_mngr.iter_dirs()
+
+    def cached_dirs(self) -> List[str]:
+        return self.dir_mngr.cached_dirs()
+
+    def scan_status(self) -> Dict[str, Any]:
+        return self.dir_mngr.scan_status()
+
+    def add(
+        self, input_dir: str, cancelled: Optional[threading.Event] = None
+    ) -> List[str]:
+        return self.dir_mngr.add(input_dir, cancelled)
+
+    def _add(self, input_dir: str) -> str:
+        return self.dir_mngr._add(input_dir)
+
+    def ignore(self, input_dir: str) -> bool:
+        return self.dir_mngr.ignore(input_dir)
+
+    def clear_added_dir(self, input_dir: str) -> bool:
+        return self.dir_mngr.clear_added_dir(input_dir)
+
+    def clear_added_dirs(self) -> bool:
+        return self.dir_mngr.clear_added_dirs()
+
+    def clear_ignored_dir(self, input_dir: str) -> bool:
+        return self.dir_mngr.clear_ignored_dir(input_dir)
+
+    def clear_ignored_dirs(self) -> bool:
+        return self.dir_mngr.clear_ignored_dirs()
+
+    def session_index(self) -> SessionIndex:
+        """SessionIndex of the current sessions snapshot, rebuilt only when
+        the snapshot changes."""
+        sessions = self.sessions()
+        if (
+            self._session_index is None
+            or self._session_index_version != self._snapshot_version
+        ):
+            self._session_index = SessionIndex(sessions, self.project_dirs)
+            self._session_index_version = self._snapshot_version
+        return self._session_index
+
     def dir_to_session_name(self, dir_path: str) -> str:
-        """Convert a directory name to tmux session name."""
+        """Convert a directory name to tmux session name, precomputed on its
+        project record."""
+        return self.project_dirs.get(dir_path).session_name
+
+    def next_session_name(self, session_name: str) -> str:
+        """Next free session name for session_name, either itself or
+        suffixed with the lowest free -N, from a single sessions snapshot."""
 
-        def replace_dots(input_str: str, replace_with: str = "-"):
-            """Replace dots since it's not allowed on tmux session names."""
-            return input_str.replace(".", replace_with)
-        return replace_dots(input_str=dir_path)
+        prefix = session_name + "-"
+        taken = set()
+        for name in self.sessions():
+            if name == session_name:
+                taken.add(0)
+            elif name.startswith(prefix) and name[len(prefix) :].isdigit():
+                taken.add(int(name[len(prefix) :]))
+        i = 0
+        while i in taken:
+            i += 1
+        return session_name if i == 0 else "{}{}".format(prefix, i)
@@ -0,0 +1,426 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import pathlib
+import select
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+from tmuxdir.markers import MarkerMatcher, RootMarker
+from tmuxdir.scanner import DirStat, ProjectWalker, compile_patterns
+
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+_WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+_EVENT = struct.Struct("iIII")
+
+
+class WatcherException(Exception):
+    def __init__(self, msg: str):
+        super().__init__(msg)
+        self.msg = msg
+
+    def __repr__(self) -> str:
+        return self.msg
+
+
+class Inotify:
+
+    """Minimal Linux inotify binding through ctypes."""
+
+    def __init__(self) -> None:
+        """Constructor of Inotify.
+        Raises WatcherException if inotify isn't available."""
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            self._libc.inotify_init1
+        except (OSError, AttributeError) as e:
+            raise WatcherException("inotify isn't available: {}".format(e))
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise WatcherException(os.strerror(ctypes.get_errno()))
+
+    def add_watch(self, path: str, mask: int) -> int:
+        """Add a watch, raises OSError if it fails, with errno ENOSPC once
+        the max_user_watches limit is reached."""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd: int) -> None:
+        """Remove a watch."""
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout: float) -> List[Tuple[int, int, str]]:
+        """Wait up to timeout seconds for events, returning (wd, mask, name)."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self) -> None:
+        """Close the inotify file descriptor."""
+        os.close(self.fd)
+
+
+class ProjectWatcher:
+
+    """Keep the projects of base_dirs up to date in memory.
+
+    Projects are found with an initial scan and then updated from file system
+    events, so reading them is cheap. This base class re-scans every interval
+    seconds, only listing directories whose mtime changed. The initial scan
+    runs on the watcher thread and, until it's done or while the watcher
+    isn't available, dirs() returns None and callers are expected to scan.
+    """
+
+    def __init__(
+        self,
+        base_dirs: List[str],
+        root_markers: List[RootMarker],
+        depth=3,
+        eager=False,
+        interval=2.0,
+        exclude_patterns: List[str] = [],
+        stop_at_projects=False,
+    ) -> None:
+        """Constructor of ProjectWatcher."""
+        self._roots = [str(pathlib.Path(os.path.expanduser(d))) for d in base_dirs]
+        self._matcher = MarkerMatcher(root_markers)
+        self._depth = depth
+        self._eager = eager
+        self._interval = interval
+        self._exclude_patterns = exclude_patterns
+        self._exclude = compile_patterns(exclude_patterns)
+        self._stop_at_projects = stop_at_projects
+        self._home = str(pathlib.Path.home())
+        self._home_prefix = self._home + os.path.sep
+
+        # project dir -> (root index, depth level)
+        self._projects: Dict[str, Tuple[int, int]] = {}
+        self._cache: Dict[str, DirStat] = {}
+        self._lock = threading.Lock()
+        self._version = 0
+        self._dirs_version = -1
+        self._dirs: List[str] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self.available = False
+
+    def start(self) -> None:
+        """Start watching in a daemon thread, which runs the initial scan
+        first, so it returns right away."""
+        self._thread = threading.Thread(target=self._main, daemon=True)
+        self._thread.start()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Wait up to timeout seconds for the initial scan.
+        Return whether the watcher is available."""
+        self._ready.wait(timeout)
+        return self.available
+
+    def _main(self) -> None:
+        try:
+            self._setup()
+            self.available = not self._stop.is_set()
+        except WatcherException:
+            return
+        finally:
+            self._ready.set()
+        self._run()
+
+    def stop(self) -> None:
+        """Stop watching."""
+        self.available = False
+        self._stop.set()
+
+    def dirs(self) -> Optional[List[str]]:
+        """~ relative project dirs, None if the watcher isn't available."""
+        if not self.available:
+            return None
+        with self._lock:
+            if self._dirs_version != self._version:
+                self._dirs = self._filter_levels()
+                self._dirs_version = self._version
+            return self._dirs
+
+    def _filter_levels(self) -> List[str]:
+        """Apply eager mode, if it's not eager only the projects at the
+        shallowest depth level of each root are kept."""
+        min_levels: Dict[int, int] = {}
+        if not self._eager:
+            for root, level in self._projects.values():
+                if level < min_levels.get(root, self._depth + 1):
+                    min_levels[root] = level
+        return [
+            "~" + d[len(self._home) :]
+            if d == self._home or d.startswith(self._home_prefix)
+            else d
+            for d, (root, level) in self._projects.items()
+            if self._eager or level == min_levels[root]
+        ]
+
+    def _level(self, root: int, dir_path: str) -> int:
+        """Depth level of dir_path within a root, the root itself being 1."""
+        rel = os.path.relpath(dir_path, self._roots[root])
+        return 1 if rel == os.curdir else rel.count(os.path.sep) + 2
+
+    def _walk(
+        self, root: int, dir_path: str, level: int
+    ) -> Tuple[Dict[str, Tuple[int, int]], Dict[str, DirStat]]:
+        """Walk dir_path found at level of root.
+        Return its projects and the visited directories."""
+        walker = ProjectWalker(
+            self._matcher,
+            depth=self._depth - level + 1,
+            eager=True,
+            cache=self._cache,
+            exclude_patterns=self._exclude_patterns,
+            stop_at_projects=self._stop_at_projects,
+        )
+        inherited = self._inherited(root, dir_path)
+        projects = {
+            d: (root, self._level(root, d))
+            for d in walker.walk(dir_path, inherited)
+        }
+        return projects, walker.visited
+
+    def _flags(self, dir_path: str) -> int:
+        """Marker flags of the entries of a directory."""
+        flags = 0
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    flags |= self._matcher.flags(entry.name)
+        except OSError:
+            pass
+        return flags
+
+    def _inherited(self, root: int, dir_path: str) -> int:
+        """Marker flags of the ancestors of dir_path within a root, only
+        listed if some marker depends on them."""
+        inherited = 0
+        if not self._matcher.needs_ancestors or dir_path == self._roots[root]:
+            return inherited
+        parent = os.path.dirname(dir_path)
+        while True:
+            inherited |= self._flags(parent)
+            if parent == self._roots[root] or parent == os.path.dirname(parent):
+                return inherited
+            parent = os.path.dirname(parent)
+
+    def _add_projects(self, projects: Dict[str, Tuple[int, int]]) -> None:
+        with self._lock:
+            for d, value in projects.items():
+                self._projects.setdefault(d, value)
+            self._version += 1
+
+    def _scan_all(self) -> None:
+        """Scan all roots, replacing the known projects."""
+        projects: Dict[str, Tuple[int, int]] = {}
+        visited: Dict[str, DirStat] = {}
+        for root, root_dir in enumerate(self._roots):
+            root_projects, root_visited = self._walk(root, root_dir, 1)
+            for d, value in root_projects.items():
+                projects.setdefault(d, value)
+            visited.update(root_visited)
+        self._cache = visited
+        with self._lock:
+            if projects != self._projects:
+                self._projects = projects
+                self._version += 1
+
+    def _setup(self) -> None:
+        self._scan_all()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            self._scan_all()
+
+
+class InotifyProjectWatcher(ProjectWatcher):
+
+    """ProjectWatcher updated from inotify events.
+
+    Every directory down to depth is watched. If the max_user_watches limit
+    is reached, or events overflow, the watcher stops being available and
+    callers fall back to scanning.
+    """
+
+    def __init__(self, *args, poll_fallback=False, **kwargs) -> None:
+        """Constructor of InotifyProjectWatcher. With poll_fallback, it polls
+        instead if the watch limit is reached by the initial scan.
+        Raises WatcherException if inotify isn't available."""
+        super().__init__(*args, **kwargs)
+        self._poll_fallback = poll_fallback
+        self.polling = False
+        self._inotify = Inotify()
+        # watch descriptor -> (root index, watched dir)
+        self._watches: Dict[int, Tuple[int, str]] = {}
+
+    def _watch(self, visited: Dict[str, DirStat], root: int) -> None:
+        """Watch visited directories of a root."""
+        for dir_path in visited:
+            try:
+                wd = self._inotify.add_watch(dir_path, _WATCH_MASK)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    raise WatcherException(
+                        "inotify watch limit reached, falling back to scanning"
+                    )
+                continue
+            self._watches[wd] = (root, dir_path)
+
+    def _setup(self) -> None:
+        try:
+            for root, root_dir in enumerate(self._roots):
+                projects, visited = self._walk(root, root_dir, 1)
+                self._add_projects(projects)
+                self._watch(visited, root)
+        except WatcherException:
+            self._inotify.close()
+            if not self._poll_fallback:
+                raise
+            self.polling = True
+            ProjectWatcher._setup(self)
+
+    def _is_marker(self, name: str) -> bool:
+        return bool(self._matcher.flags(name))
+
+    def _pruned(self, dir_path: str) -> bool:
+        """Whether a new directory shouldn't be walked, because it's excluded
+        or, with stop_at_projects, it's within a project."""
+        if self._exclude and (
+            self._exclude.match(os.path.basename(dir_path))
+            or self._exclude.match(dir_path)
+        ):
+            return True
+        if self._stop_at_projects:
+            with self._lock:
+                parent = os.path.dirname(dir_path)
+                while parent not in self._roots and parent != os.path.dirname(parent):
+                    if parent in self._projects:
+                        return True
+                    parent = os.path.dirname(parent)
+        return False
+
+    def _remove_tree(self, dir_path: str) -> None:
+        """Forget projects and watches of dir_path and below."""
+        prefix = dir_path + os.path.sep
+        with self._lock:
+            for d in [
+                d for d in self._projects if d == dir_path or d.startswith(prefix)
+            ]:
+                del self._projects[d]
+            self._version += 1
+        for wd, (_, d) in list(self._watches.items()):
+            if d == dir_path or d.startswith(prefix):
+                self._inotify.rm_watch(wd)
+                del self._watches[wd]
+
+    def _check_project(self, root: int, dir_path: str) -> None:
+        """Re-evaluate root markers of a single directory."""
+        flags = self._flags(dir_path)
+        inherited = self._inherited(root, dir_path)
+        is_project = self._matcher.is_project(flags, inherited)
+        with self._lock:
+            if is_project:
+                self._projects[dir_path] = (root, self._level(root, dir_path))
+            else:
+                self._projects.pop(dir_path, None)
+            self._version += 1
+
+    def _handle(self, wd: int, mask: int, name: str) -> None:
+        if mask & IN_Q_OVERFLOW:
+            raise WatcherException("inotify queue overflow, falling back to scanning")
+        if mask & IN_IGNORED:
+            self._watches.pop(wd, None)
+            return
+        if wd not in self._watches:
+            return
+        root, dir_path = self._watches[wd]
+        path = os.path.join(dir_path, name)
+        if self._is_marker(name):
+            self._check_project(root, dir_path)
+        if not mask & IN_ISDIR:
+            return
+        if mask & (IN_DELETE | IN_MOVED_FROM):
+            self._remove_tree(path)
+        elif mask & (IN_CREATE | IN_MOVED_TO):
+            level = self._level(root, path)
+            if level <= self._depth and not self._pruned(path):
+                projects, visited = self._walk(root, path, level)
+                self._add_projects(projects)
+                self._watch(visited, root)
+
+    def _run(self) -> None:
+        if self.polling:
+            ProjectWatcher._run(self)
+            return
+        try:
+            while not self._stop.is_set():
+                for wd, mask, name in self._inotify.read(self._interval):
+                    self._handle(wd, mask, name)
+        except WatcherException:
+            self.available = False
+        finally:
+            self._inotify.close()
+
+
+def start_watcher(
+    mode: str,
+    base_dirs: List[str],
+    root_markers: List[RootMarker],
+    eager=False,
+    **kwargs
+) -> Optional[ProjectWatcher]:
+    """Start a watcher given a watch mode, 'inotify', 'poll' or 'auto', which
+    uses inotify when it's available and polling otherwise, or once the watch
+    limit is reached. kwargs are passed to the watcher. Its initial scan runs
+    in the background.
+    Return None if mode is 'off' or the watcher couldn't start."""
+    watchers: Dict[str, List[Tuple[type, Dict]]] = {
+        "inotify": [(InotifyProjectWatcher, {})],
+        "poll": [(ProjectWatcher, {})],
+        "auto": [
+            (InotifyProjectWatcher, {"poll_fallback": True}),
+            (ProjectWatcher, {}),
+        ],
+    }
+    for watcher_cls, extra in watchers.get(mode, []):
+        try:
+            watcher = watcher_cls(
+                base_dirs, root_markers, eager=eager, **extra, **kwargs
+            )
+            watcher.start()
+            return watcher
+        except WatcherException:
+            continue
+    return None